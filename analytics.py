@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from typing import Any
+
+import pandas as pd
+
+import db
+
+
+# Time-bucketed sales for charts. Buckets are binned in Postgres and merged
+# there (a wider date_bin stride) until the series has at most max_points
+# rows, so a chart never receives more points than it can draw. Day, week
+# and month buckets over whole days are summed from a rollup:
+# sales_daily_cashier, or sales_daily when filtering by item. Hourly buckets
+# and ranges cut mid-day scan sales, where the BRIN index on sold_at narrows
+# the scan to the block ranges holding the period. Buckets follow the
+# session time zone, as the rollups and the Sales filters do.
+
+BUCKETS: dict[str, timedelta | None] = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+    "month": None,  # calendar months: date_trunc, never merged
+}
+
+# date_bin origin: a Monday midnight, so weeks start on Monday like date_trunc('week').
+_ORIGIN = datetime(2001, 1, 1)
+
+_SERIES_SCHEMA = {"revenue": "float64", "qty": "float64", "transactions": "int64"}
+
+
+@dataclass(frozen=True)
+class SalesSeries:
+    df: pd.DataFrame  # bucket, revenue, qty, transactions; empty buckets are zero
+    bucket: str
+    stride: timedelta | None  # width of one point; None for calendar months
+    source: str  # the table summed: "sales_daily_cashier", "sales_daily" or "sales"
+
+
+def max_points() -> int:
+    return int(db._setting("ANALYTICS_MAX_POINTS", "500"))
+
+
+def auto_bucket(start: datetime, end: datetime) -> str:
+    span = end - start
+    if span <= timedelta(days=3):
+        return "hour"
+    if span <= timedelta(days=120):
+        return "day"
+    if span <= timedelta(days=3 * 365):
+        return "week"
+    return "month"
+
+
+def _stride(filters: db.SalesFilter, bucket: str, points: int) -> timedelta | None:
+    unit = BUCKETS[bucket]
+    if unit is None:
+        return None
+    buckets = math.ceil((filters.end - filters.start) / unit)
+    return unit * max(1, math.ceil(buckets / points))
+
+
+def _source(filters: db.SalesFilter, bucket: str) -> str:
+    if bucket == "hour" or filters.start.time() != time() or filters.end.time() != time():
+        return "sales"
+    return "sales_daily" if filters.item_search.strip() else "sales_daily_cashier"
+
+
+def _series_query(filters: db.SalesFilter, bucket: str, stride: timedelta | None) -> db.Query:
+    source = _source(filters, bucket)
+    if source == "sales":
+        where_sql, where_params = filters.where()
+        column = "s.sold_at::timestamp"
+        measures = "sum(s.line_total) as revenue, sum(s.qty) as qty, count(*) as transactions"
+        relation = "sales s"
+    else:
+        where_sql, where_params = filters.where_daily()
+        column = "d.day::timestamp"
+        measures = "sum(d.revenue) as revenue, sum(d.qty) as qty, sum(d.transactions) as transactions"
+        relation = f"{source} d"
+
+    if stride is None:
+        bin_sql, bin_params = f"date_trunc('month', {column})", []
+        series_sql = "generate_series(date_trunc('month', %s::timestamp), %s::timestamp - interval '1 microsecond', interval '1 month')"
+        series_params = [filters.start, filters.end]
+    else:
+        bin_sql, bin_params = f"date_bin(%s::interval, {column}, %s::timestamp)", [stride, _ORIGIN]
+        series_sql = "generate_series(date_bin(%s::interval, %s::timestamp, %s::timestamp), %s::timestamp - interval '1 microsecond', %s::interval)"
+        series_params = [stride, filters.start, _ORIGIN, filters.end, stride]
+    params: list[Any] = [*bin_params, *where_params, *series_params]
+
+    return db.Query(
+        f"""
+        with binned as (
+          select {bin_sql} as bucket, {measures}
+          from {relation}
+          where {where_sql}
+          group by 1
+        )
+        select
+          g.bucket,
+          coalesce(b.revenue, 0) as revenue,
+          coalesce(b.qty, 0) as qty,
+          coalesce(b.transactions, 0) as transactions
+        from {series_sql} as g(bucket)
+        left join binned b on b.bucket = g.bucket
+        order by g.bucket
+        """,
+        tuple(params),
+        _SERIES_SCHEMA,
+    )
+
+
+def sales_series(filters: db.SalesFilter, bucket: str | None = None, *, points: int | None = None) -> SalesSeries:
+    # bucket None picks one from the range's length (auto_bucket).
+    bucket = bucket or auto_bucket(filters.start, filters.end)
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket {bucket}.")
+    stride = _stride(filters, bucket, points or max_points())
+    query = _series_query(filters, bucket, stride)
+    return SalesSeries(
+        df=db.query_df(query.sql, query.params, schema=query.schema),
+        bucket=bucket,
+        stride=stride,
+        source=_source(filters, bucket),
+    )
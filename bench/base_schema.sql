@@ -0,0 +1,63 @@
+-- The tables and triggers the app expects to exist (see README, Notes).
+-- Everything else (sales_daily, updated_at, notify triggers, indexes) is
+-- provisioned by schema.ensure().
+
+create table cashiers (
+  cashier_id bigserial primary key,
+  full_name text not null,
+  username text unique,
+  active boolean not null default true,
+  created_at timestamptz not null default now()
+);
+
+create table items (
+  item_id bigserial primary key,
+  item_name text not null,
+  sku text unique,
+  barcode text unique,
+  unit text not null default 'pcs',
+  qty_on_hand numeric(14, 3) not null default 0,
+  sell_price numeric(12, 2) not null default 0,
+  active boolean not null default true,
+  created_at timestamptz not null default now()
+);
+
+create table sales (
+  sale_id bigserial primary key,
+  sold_at timestamptz not null default now(),
+  cashier_id bigint not null references cashiers (cashier_id),
+  item_id bigint not null references items (item_id),
+  qty numeric(14, 3) not null check (qty > 0),
+  unit_price numeric(12, 2) not null,
+  line_total numeric(14, 2) generated always as (round(qty * unit_price, 2)) stored
+);
+
+create or replace function prevent_oversell() returns trigger
+language plpgsql as $$
+declare
+  on_hand numeric;
+begin
+  select qty_on_hand into on_hand from items where item_id = new.item_id for update;
+  if on_hand is null then
+    raise exception 'Item % does not exist', new.item_id;
+  end if;
+  if on_hand < new.qty then
+    raise exception 'Insufficient stock for item %: on hand %, requested %', new.item_id, on_hand, new.qty;
+  end if;
+  return new;
+end
+$$;
+
+create or replace function decrement_stock_after_sale() returns trigger
+language plpgsql as $$
+begin
+  update items set qty_on_hand = qty_on_hand - new.qty where item_id = new.item_id;
+  return new;
+end
+$$;
+
+create trigger prevent_oversell before insert on sales
+  for each row execute function prevent_oversell();
+
+create trigger decrement_stock_after_sale after insert on sales
+  for each row execute function decrement_stock_after_sale();
@@ -0,0 +1,230 @@
+"""Drive the sale path with concurrent simulated cashiers.
+
+    python -m bench.loadtest --cashiers 8 --duration 30 [--hot-items 200 --skew 2]
+                             [--lines 1-3] [--fast] [--restock 50] [--json]
+
+Each cashier is a thread calling db.record_sales (or db.fast_sale with
+--fast), the same code the Sell page runs, through the app's connection pool
+(size it with DB_POOL_MAX_SIZE as in production). Items are drawn from the
+--hot-items lowest ids with a power-law skew: 1 is uniform, higher values
+concentrate sales on the first few items and so on their row locks.
+--restock sets those items' stock before the run so oversell rejections
+show up. Targets BENCH_DATABASE_URL (falling back to DATABASE_URL); the
+sales are real inserts, so use a scratch database.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from typing import Any
+
+
+def _percentile(samples: list[float], q: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * q))] if samples else 0.0
+
+
+class _LockMonitor:
+    # Samples backends waiting on heavyweight locks from its own connection.
+    def __init__(self, url: str, interval: float = 0.1) -> None:
+        self._url = url
+        self._interval = interval
+        self._stop = threading.Event()
+        self.samples: list[int] = []
+        self._thread = threading.Thread(target=self._run, name="lock-monitor", daemon=True)
+
+    def _run(self) -> None:
+        import psycopg
+
+        with psycopg.connect(self._url, autocommit=True) as conn:
+            while not self._stop.wait(self._interval):
+                self.samples.append(
+                    conn.execute(
+                        "select count(*) from pg_stat_activity where wait_event_type = 'Lock' and datname = current_database()"
+                    ).fetchone()[0]
+                )
+
+    def __enter__(self) -> _LockMonitor:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def run(
+    cashiers: int,
+    duration: float,
+    hot_items: int,
+    skew: float,
+    lines: tuple[int, int],
+    fast: bool,
+    restock: int | None,
+) -> dict[str, Any]:
+    import psycopg
+
+    import db
+    import schema
+
+    schema.ensure()  # provisions the stock model STOCK_LEDGER selects, as the app does
+    item_ids = [
+        row["item_id"]
+        for row in db.execute(
+            "select item_id from items where active is true order by item_id limit %s", (hot_items,), fetchall=True
+        )
+    ]
+    cashier_ids = [row["cashier_id"] for row in db.execute("select cashier_id from cashiers where active is true", fetchall=True)]
+    if not item_ids or not cashier_ids:
+        raise SystemExit("Need active items and cashiers; seed the database with bench.seed first.")
+    if restock is not None:
+        relation = "items_on_hand" if db.stock_ledger_enabled() else "items"
+        db.execute(f"update {relation} set qty_on_hand = %s where item_id = any(%s)", (restock, item_ids))
+
+    def deadlocks() -> int:
+        return db.execute(
+            "select deadlocks from pg_stat_database where datname = current_database()", fetchone=True
+        )["deadlocks"]
+
+    latencies: list[float] = []
+    outcomes: Counter[str] = Counter()
+    sold_lines = 0
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def cashier(seed: int) -> None:
+        nonlocal sold_lines
+        rng = random.Random(seed)
+        cashier_id = rng.choice(cashier_ids)
+        while not stop.is_set():
+            count = 1 if fast else rng.randint(*lines)
+            basket = [
+                (item_ids[int(len(item_ids) * rng.random() ** skew)], Decimal(rng.randint(1, 3))) for _ in range(count)
+            ]
+            started = time.perf_counter()
+            try:
+                if fast:
+                    db.fast_sale(cashier_id, *basket[0])
+                else:
+                    db.record_sales(cashier_id, basket)
+                outcome = "ok"
+            except db.SaleRejected:
+                outcome = "rejected"
+            except psycopg.errors.DeadlockDetected:
+                outcome = "deadlock"
+            except psycopg.errors.LockNotAvailable:
+                outcome = "lock_timeout"
+            except psycopg.errors.QueryCanceled:
+                outcome = "statement_timeout"
+            except Exception as exc:
+                outcome = f"error: {type(exc).__name__}"
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                outcomes[outcome] += 1
+                if outcome == "ok":
+                    latencies.append(elapsed)
+                    sold_lines += len({item_id for item_id, _ in basket})
+
+    db.query_df("select 1 as ok")  # open the pool before the clock starts
+    deadlocks_before = deadlocks()
+    threads = [threading.Thread(target=cashier, args=(n,), name=f"cashier-{n}") for n in range(cashiers)]
+    with _LockMonitor(os.environ["DATABASE_URL"]) as monitor:
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    pool = db.pool_stats()
+    return {
+        "config": {
+            "cashiers": cashiers,
+            "duration_s": duration,
+            "hot_items": len(item_ids),
+            "skew": skew,
+            "lines": list(lines),
+            "fast_sale": fast,
+            "restock": restock,
+            "stock_ledger": db.stock_ledger_enabled(),
+            "pool_max": pool.get("pool_max"),
+        },
+        "sales": outcomes["ok"],
+        "sales_per_sec": round(outcomes["ok"] / elapsed, 1),
+        "lines_per_sec": round(sold_lines / elapsed, 1),
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+            "p50": round(_percentile(latencies, 0.50), 2),
+            "p95": round(_percentile(latencies, 0.95), 2),
+            "p99": round(_percentile(latencies, 0.99), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+        },
+        "outcomes": dict(outcomes),
+        "deadlocks": deadlocks() - deadlocks_before,
+        "lock_waiters": {
+            "mean": round(statistics.fmean(monitor.samples), 2) if monitor.samples else 0.0,
+            "max": max(monitor.samples, default=0),
+        },
+        "pool": {
+            "checkout_ms": pool["checkout_ms"],
+            "requests_queued": pool.get("requests_queued", 0),
+            "requests_wait_ms": pool.get("requests_wait_ms", 0),
+            "errors": pool.get("requests_errors", 0) + pool.get("connections_errors", 0),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cashiers", type=int, default=8, help="concurrent simulated cashiers (threads)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--hot-items", type=int, default=200, help="sell from this many items")
+    parser.add_argument("--skew", type=float, default=2.0, help="power-law skew over the hot items (1 = uniform)")
+    parser.add_argument("--lines", default="1-3", help="lines per sale, e.g. 1 or 1-5")
+    parser.add_argument("--fast", action="store_true", help="use db.fast_sale (single-line sales)")
+    parser.add_argument("--restock", type=int, help="set the hot items' qty_on_hand to this before the run")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    url = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not url:
+        raise SystemExit("Set BENCH_DATABASE_URL (or DATABASE_URL) to a scratch database.")
+    os.environ["DATABASE_URL"] = url
+    low, _, high = args.lines.partition("-")
+
+    result = run(
+        args.cashiers,
+        args.duration,
+        args.hot_items,
+        args.skew,
+        (int(low), int(high or low)),
+        args.fast,
+        args.restock,
+    )
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    latency = result["latency_ms"]
+    print(f"{result['sales']} sales in {args.duration:.0f}s: {result['sales_per_sec']} sales/s, {result['lines_per_sec']} lines/s")
+    print(f"latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"outcomes: {result['outcomes']}  deadlocks: {result['deadlocks']}")
+    print(f"lock waiters: mean {result['lock_waiters']['mean']}, max {result['lock_waiters']['max']}")
+    pool = result["pool"]
+    print(
+        f"pool (max {result['config']['pool_max']}): checkout p95 {pool['checkout_ms']['p95']:.1f} ms,"
+        f" {pool['requests_queued']} requests queued, {pool['requests_wait_ms']} ms waited"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Compare db.query_df materialization paths on a large synthetic result.
+
+    python -m bench.materialize --rows 1000000 [--json]
+
+Each path runs in a fresh process so peak RSS is measured in isolation.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import resource
+import time
+from typing import Any
+
+SQL = """
+select
+  g as sale_id,
+  now() - g * interval '1 second' as sold_at,
+  'Cashier ' || (g %% 500) as cashier,
+  'Item ' || (g %% 50000) as item_name,
+  (g %% 7 + 1)::numeric(14, 3) as qty,
+  ((g %% 1000) / 100.0)::numeric(12, 2) as unit_price,
+  ((g %% 7 + 1) * (g %% 1000) / 100.0)::numeric(14, 2) as line_total
+from generate_series(1, %s) as g
+"""
+
+SCHEMA = {
+    "sale_id": "int64",
+    "sold_at": "timestamp",
+    "cashier": "string",
+    "item_name": "string",
+    "qty": "decimal",
+    "unit_price": "decimal",
+    "line_total": "float64",
+}
+
+MODES = ("dict_row", "tuples", "arrow")
+
+
+def _maxrss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run(mode: str, rows: int, results: Any) -> None:
+    import pandas as pd
+    from psycopg.rows import dict_row
+
+    import db
+
+    db.query_df("select 1 as ok")
+    baseline = _maxrss_mb()
+
+    started = time.perf_counter()
+    if mode == "dict_row":
+        # The original query_df: one dict per row, DataFrame from a list of dicts.
+        with db.transaction() as conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(SQL, (rows,))
+                df = pd.DataFrame(cur.fetchall())
+    elif mode == "tuples":
+        df = db.query_df(SQL, (rows,))
+    else:
+        df = db.query_df(SQL, (rows,), schema=SCHEMA)
+    fetched = time.perf_counter() - started
+
+    started = time.perf_counter()
+    df["line_total"].sum()
+    summed = time.perf_counter() - started
+
+    results.put(
+        {
+            "mode": mode,
+            "rows": len(df),
+            "seconds": round(fetched, 3),
+            "rows_per_sec": round(len(df) / fetched),
+            "peak_rss_mb": round(_maxrss_mb() - baseline, 1),
+            "sum_ms": round(summed * 1000, 2),
+        }
+    )
+
+
+def run(rows: int, modes: tuple[str, ...] = MODES) -> list[dict[str, Any]]:
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for mode in modes:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run, args=(mode, rows, queue))
+        proc.start()
+        results.append(queue.get())
+        proc.join()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--mode", choices=MODES, action="append", help="run only these paths")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = run(args.rows, tuple(args.mode or MODES))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<10} {'rows':>9} {'seconds':>8} {'rows/sec':>10} {'peak MB':>8} {'sum ms':>8}")
+    for r in results:
+        print(
+            f"{r['mode']:<10} {r['rows']:>9} {r['seconds']:>8} {r['rows_per_sec']:>10} "
+            f"{r['peak_rss_mb']:>8} {r['sum_ms']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
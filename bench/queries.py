@@ -0,0 +1,195 @@
+"""Time the queries each page issues against a seeded database.
+
+    python -m bench.queries [--repeat 20] [--out results.json]
+                            [--thresholds bench/thresholds.json]
+                            [--baseline previous.json --tolerance 1.25]
+
+Targets BENCH_DATABASE_URL (falling back to DATABASE_URL), normally a
+database filled by bench.seed. The POS sale cases insert real sales. Results
+are written as JSON: p50/p95/max milliseconds and row counts per case, plus
+the commit and data volumes they were measured at. Exits with status 1 when
+a case's p95 exceeds its threshold, or exceeds the baseline's p95 by more
+than the tolerance.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable
+
+THRESHOLDS = Path(__file__).with_name("thresholds.json")
+
+
+def _cases() -> dict[str, Callable[[], Any]]:
+    import analytics
+    import db
+
+    end = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    week = db.SalesFilter(start=end - timedelta(days=7), end=end)
+    quarter = db.SalesFilter(start=end - timedelta(days=90), end=end)
+    first = db.execute(
+        """
+        select
+          (select min(cashier_id) from cashiers where active) as cashier_id,
+          (select item_id from items where active order by item_id limit 1) as item_id,
+          (select sku from items where active order by item_id desc limit 1) as sku
+        """,
+        fetchone=True,
+    )
+    by_cashier = db.SalesFilter(start=quarter.start, end=end, cashier_id=first["cashier_id"])
+    by_item = db.SalesFilter(start=quarter.start, end=end, item_search="milk")
+    year = db.SalesFilter(start=end - timedelta(days=365), end=end)
+
+    def deep_page(filters: db.SalesFilter, pages: int = 10, size: int = 100) -> Any:
+        after = None
+        for _ in range(pages):
+            page = db.sales_page(filters, after=after, limit=size)
+            if page.empty:
+                break
+            after = (page["sold_at"].iloc[-1], int(page["sale_id"].iloc[-1]))
+        return page
+
+    sync = db._CatalogSync(full_interval=float("inf"), sync_interval=0)
+    sync.get()
+
+    return {
+        "dashboard.kpi": lambda: db.query_df(db._SQL_DASHBOARD_KPI),
+        "dashboard.stock": lambda: db.query_df(db._SQL_DASHBOARD_STOCK),
+        "dashboard.top_items": lambda: db.query_df(db._SQL_DASHBOARD_TOP_ITEMS),
+        "dashboard.trend": lambda: db.query_df(db._SQL_DASHBOARD_TREND),
+        "sales.totals.week": lambda: db.sales_totals(week),
+        "sales.page.week": lambda: db.sales_page(week, limit=101),
+        "sales.page.week.10th": lambda: deep_page(week),
+        "sales.totals.quarter": lambda: db.sales_totals(quarter),
+        "sales.page.quarter.cashier": lambda: db.sales_page(by_cashier, limit=101),
+        "sales.totals.quarter.item_search": lambda: db.sales_totals(by_item),
+        "sales.page.quarter.item_search": lambda: db.sales_page(by_item, limit=101),
+        "analytics.year.week": lambda: analytics.sales_series(year, "week").df,
+        "analytics.year.day": lambda: analytics.sales_series(year, "day").df,
+        "analytics.quarter.day.item_search": lambda: analytics.sales_series(by_item, "day").df,
+        "analytics.month.hour": lambda: analytics.sales_series(
+            db.SalesFilter(start=end - timedelta(days=30), end=end), "hour"
+        ).df,
+        "items.search.name": lambda: db.search_items("choco"),
+        "items.search.sku": lambda: db.search_items(first["sku"]),
+        "items.search.all": lambda: db.search_items(""),
+        "cashiers.search": lambda: db.search_cashiers("shier 4"),
+        "pos.catalog.load": lambda: sync._load(),
+        "pos.catalog.sync": lambda: sync._sync(),
+        # find_pos_item's database lookup, run as it does on a catalog miss.
+        "pos.find_item.db": lambda: db.query_df(db._SQL_FIND_POS_ITEM, (first["sku"], first["sku"])),
+        "pos.record_sale": lambda: db.record_sales(
+            first["cashier_id"], [(first["item_id"], Decimal(1)), (first["item_id"] + 1, Decimal(2))]
+        ),
+        "pos.fast_sale": lambda: db.fast_sale(first["cashier_id"], first["item_id"], Decimal(1)),
+    }
+
+
+def _rows(result: Any) -> int | None:
+    if hasattr(result, "__len__"):
+        return len(result)
+    return None
+
+
+def run(repeat: int, only: list[str] | None = None) -> dict[str, Any]:
+    import db
+
+    cases = _cases()
+    results: dict[str, Any] = {}
+    for name, case in cases.items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        result = case()  # warm-up: plan caches, prepared statements, buffers
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = case()
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        results[name] = {
+            "n": repeat,
+            "p50_ms": round(statistics.median(samples), 3),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+            "max_ms": round(samples[-1], 3),
+            "rows": _rows(result),
+        }
+        print(f"{name:<36} p50 {results[name]['p50_ms']:>9.2f} ms   p95 {results[name]['p95_ms']:>9.2f} ms", file=sys.stderr)
+
+    volumes = db.execute(
+        """
+        select
+          (select count(*) from items) as items,
+          (select count(*) from cashiers) as cashiers,
+          (select reltuples::bigint from pg_class where oid = 'sales'::regclass) as sales_estimate,
+          current_setting('server_version') as server_version
+        """,
+        fetchone=True,
+    )
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "meta": {"commit": commit, "taken_at": datetime.now().isoformat(timespec="seconds"), "repeat": repeat, **volumes},
+        "cases": results,
+    }
+
+
+def check(results: dict[str, Any], thresholds: dict[str, float], baseline: dict[str, Any] | None, tolerance: float) -> list[str]:
+    failures = []
+    for name, case in results["cases"].items():
+        limit = thresholds.get(name)
+        if limit is not None and case["p95_ms"] > limit:
+            failures.append(f"{name}: p95 {case['p95_ms']} ms > threshold {limit} ms")
+        previous = (baseline or {}).get("cases", {}).get(name)
+        if previous and case["p95_ms"] > previous["p95_ms"] * tolerance:
+            failures.append(
+                f"{name}: p95 {case['p95_ms']} ms > {tolerance}x baseline {previous['p95_ms']} ms"
+                f" ({baseline['meta'].get('commit')})"
+            )
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--case", action="append", help="run only cases starting with this prefix")
+    parser.add_argument("--out", help="write results JSON here (default: stdout)")
+    parser.add_argument("--thresholds", default=str(THRESHOLDS), help="JSON of case -> max p95 ms")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed p95 ratio against the baseline")
+    args = parser.parse_args()
+
+    url = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not url:
+        raise SystemExit("Set BENCH_DATABASE_URL (or DATABASE_URL) to a seeded scratch database.")
+    os.environ["DATABASE_URL"] = url
+
+    results = run(args.repeat, args.case)
+    output = json.dumps(results, indent=2, default=str)
+    if args.out:
+        Path(args.out).write_text(output + "\n")
+    else:
+        print(output)
+
+    thresholds = json.loads(Path(args.thresholds).read_text()) if args.thresholds else {}
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    failures = check(results, thresholds, baseline, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
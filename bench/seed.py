@@ -0,0 +1,162 @@
+"""Populate a scratch Postgres with synthetic cashiers, items and sales.
+
+    python -m bench.seed --items 50000 --cashiers 500 --sales 10000000 [--reset] [--partition]
+
+Targets BENCH_DATABASE_URL (falling back to DATABASE_URL). With --reset the
+app's tables are dropped and recreated from bench/base_schema.sql first;
+without it the database must not contain items yet. Never point this at a
+database whose data you want to keep.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+import psycopg
+
+BASE_SCHEMA = Path(__file__).with_name("base_schema.sql")
+
+_DROP = """
+drop table if exists sales, sales_unpartitioned, sales_daily, sales_daily_cashier, queued_sale_refs, stock_movements, items, cashiers cascade;
+drop function if exists
+  sales_daily_apply, bootcampx_notify_change, items_touch_updated_at,
+  stock_ledger_sales, stock_ledger_compact, items_on_hand_update cascade;
+"""
+
+_WORDS = [
+    "milk", "bread", "rice", "sugar", "coffee", "tea", "soap", "juice", "water", "eggs",
+    "butter", "cheese", "flour", "salt", "oil", "beans", "pasta", "noodles", "biscuits", "chocolate",
+]
+
+_SQL_CASHIERS = """
+insert into cashiers (full_name, username, active)
+select 'Cashier ' || g, 'cashier' || g, g %% 20 <> 0
+from generate_series(1, %s) as g
+"""
+
+# Prices follow the item id so sales can derive unit_price without a join.
+_SQL_ITEMS = """
+insert into items (item_name, sku, barcode, unit, qty_on_hand, sell_price, active)
+select
+  initcap((%s::text[])[1 + g %% 20]) || ' ' || (%s::text[])[1 + (g / 20) %% 20] || ' ' || g,
+  'SKU' || lpad(g::text, 7, '0'),
+  lpad((4800000000000 + g)::text, 13, '0'),
+  case when g %% 10 = 0 then 'kg' else 'pcs' end,
+  1000000,
+  ((g %% 1000) + 99) / 100.0,
+  g %% 50 <> 0
+from generate_series(1, %s) as g
+"""
+
+# Item popularity is skewed (power law). Sales spread evenly over --days and
+# are generated in sold_at order, as tills append them, so the heap is
+# physically ordered by time like a real sales table (the BRIN index relies
+# on that).
+_SQL_SALES = """
+insert into sales (sold_at, cashier_id, item_id, qty, unit_price)
+select
+  %(start)s::timestamptz + make_interval(secs => (%(offset)s + g + random()) * %(step)s),
+  %(first_cashier)s + floor(random() * %(cashiers)s)::bigint,
+  item_id,
+  1 + floor(random() * 3),
+  (((item_id - %(first_item)s + 1) %% 1000) + 99) / 100.0
+from (
+  select g, %(first_item)s + floor(power(random(), 3) * %(items)s)::bigint as item_id
+  from generate_series(0, %(rows)s - 1) as g
+) as s
+"""
+
+
+def seed(url: str, items: int, cashiers: int, sales: int, days: int, reset: bool, batch: int) -> None:
+    with psycopg.connect(url, autocommit=True) as conn:
+        if reset:
+            conn.execute(_DROP)
+            conn.execute(BASE_SCHEMA.read_text())
+        elif conn.execute("select to_regclass('items') is null").fetchone()[0]:
+            conn.execute(BASE_SCHEMA.read_text())
+        elif conn.execute("select exists (select 1 from items)").fetchone()[0]:
+            raise SystemExit("items is not empty; rerun with --reset to replace the data.")
+
+        started = time.perf_counter()
+        conn.execute(_SQL_CASHIERS, (cashiers,))
+        conn.execute(_SQL_ITEMS, (_WORDS, _WORDS, items))
+        first_cashier, first_item = conn.execute(
+            "select (select min(cashier_id) from cashiers), (select min(item_id) from items)"
+        ).fetchone()
+        print(f"{cashiers} cashiers, {items} items in {time.perf_counter() - started:.1f}s")
+
+        # The per-row stock triggers would turn the load into millions of item
+        # updates; stock is set high enough up front instead. A superuser can
+        # also skip the per-row foreign key checks (generated ids are valid by
+        # construction), as long as no app trigger (the sales_daily rollup)
+        # would be skipped with them.
+        replica = conn.execute(
+            "select rolsuper and to_regclass('sales_daily') is null from pg_roles where rolname = current_user"
+        ).fetchone()[0]
+        if replica:
+            conn.execute("set session_replication_role = replica")
+        conn.execute("alter table sales disable trigger prevent_oversell, disable trigger decrement_stock_after_sale")
+        try:
+            start = conn.execute("select now() - make_interval(days => %s)", (days,)).fetchone()[0]
+            step = days * 86400 / max(sales, 1)
+            done = 0
+            while done < sales:
+                rows = min(batch, sales - done)
+                conn.execute(
+                    _SQL_SALES,
+                    {
+                        "start": start,
+                        "offset": done,
+                        "step": step,
+                        "first_cashier": first_cashier,
+                        "cashiers": cashiers,
+                        "first_item": first_item,
+                        "items": items,
+                        "rows": rows,
+                    },
+                )
+                done += rows
+                elapsed = time.perf_counter() - started
+                print(f"{done} sales, {elapsed:.1f}s")
+        finally:
+            conn.execute("alter table sales enable trigger prevent_oversell, enable trigger decrement_stock_after_sale")
+            conn.execute("reset session_replication_role")
+        conn.execute("vacuum analyze cashiers, items, sales")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=50_000)
+    parser.add_argument("--cashiers", type=int, default=500)
+    parser.add_argument("--sales", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=365, help="spread sales over this many days back from now")
+    parser.add_argument("--batch", type=int, default=1_000_000, help="sales per insert statement")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate the app's tables first")
+    parser.add_argument("--partition", action="store_true", help="convert sales to monthly partitions afterwards")
+    args = parser.parse_args()
+
+    url = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not url:
+        raise SystemExit("Set BENCH_DATABASE_URL (or DATABASE_URL) to a scratch database.")
+    os.environ["DATABASE_URL"] = url
+
+    seed(url, args.items, args.cashiers, args.sales, args.days, args.reset, args.batch)
+
+    # Provision what the app adds on first start (rollup backfill, triggers,
+    # indexes) the same way the app does.
+    import db
+    import schema
+
+    started = time.perf_counter()
+    if args.partition:
+        with db.transaction() as conn:
+            schema.partition_sales(conn)
+    schema.ensure()
+    print(f"schema.ensure() in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime
+
+import streamlit as st
+
+import db
+import sale_queue
+import schema
+import ui
+
+
+def page(page_title: str, title: str | None = None) -> None:
+    # Shared start of every page: page config, branding, title, the
+    # DATABASE_URL check (stops the script when it is missing) and the app's
+    # database objects (with the sales partitions rechecked now and then).
+    # Also kicks off the once-per-process prewarm and keep-warm threads.
+    # While the prewarm thread provisions the schema, the page waits on it
+    # behind a notice; the schema.ensure() after that is a cache hit, and
+    # only does the work itself with PREWARM=0 or after a failed prewarm.
+    st.set_page_config(page_title=page_title, page_icon=ui.logo(), layout="wide")
+    ui.render_branding()
+    st.title(title or page_title)
+    if not db.is_configured():
+        st.warning("`DATABASE_URL` is not set.")
+        st.stop()
+    warm = prewarm()
+    db.keep_warm()
+    if warm is not None:
+        _wait_for_schema(warm)
+    schema.ensure()
+    schema.check_sales_partitions()
+
+
+def _wait_for_schema(warm: _Prewarm) -> None:
+    # Each pass updates the notice, so a rerun (e.g. opening another page)
+    # interrupts the wait.
+    if warm.wait_schema(0.2):
+        return
+    notice = st.empty()
+    while not warm.wait_schema(0.5):
+        notice.info(f"Connecting to the database (since {warm.started_at:%H:%M:%S}). The page loads when it is ready.")
+    notice.empty()
+
+
+@st.cache_data(ttl=int(db._setting("HEALTH_CHECK_SECONDS", "15")), show_spinner=False)
+def health_check() -> float:
+    # Round-trip time in ms. Failures raise and are not cached, so a broken
+    # connection is retried on the next load.
+    started = time.perf_counter()
+    db.execute("select 1")
+    return (time.perf_counter() - started) * 1000
+
+
+class _Prewarm:
+    # Opens the pool (waking a suspended database), provisions the schema and
+    # loads the shared caches on a background thread, so the first page a
+    # cashier opens finds them ready instead of paying for them.
+    def __init__(self) -> None:
+        self.started_at = datetime.now()
+        self.seconds: float | None = None
+        self.error: str | None = None
+        self._done = threading.Event()
+        self._schema = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait_schema(self, timeout: float) -> bool:
+        # True once the schema is provisioned, or once the prewarm has given up.
+        return self._schema.wait(timeout) or self.done
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="bootcampx-prewarm", daemon=True).start()
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        try:
+            schema.ensure()
+            self._schema.set()
+            db.pos_catalog()  # also starts the change listener
+            db.active_cashiers()
+            db.items_index()
+            db.dashboard_snapshot()
+            if sale_queue.enabled():
+                sale_queue.get()
+        except Exception as exc:
+            self.error = db.error_message(exc)
+        finally:
+            self.seconds = time.perf_counter() - started
+            self._done.set()
+
+
+@st.cache_resource
+def prewarm() -> _Prewarm | None:
+    if not db._flag("PREWARM", True) or not db.is_configured():
+        return None
+    warm = _Prewarm()
+    warm.start()
+    return warm
@@ -1,10 +1,26 @@
 from __future__ import annotations
 
+import asyncio
+import bisect
+import csv
+import functools
+import logging
 import os
-from contextlib import contextmanager
-from typing import Any, Iterable
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Iterable, Sequence
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import streamlit as st
 
 try:
@@ -15,11 +31,18 @@ except Exception:
     pass
 
 import psycopg
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
 from psycopg.rows import dict_row
-from psycopg_pool import ConnectionPool
+from psycopg.types.numeric import Int8
+from psycopg.types.string import TextLoader
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 
+_logger = logging.getLogger(__name__)
 
+
+@functools.lru_cache(maxsize=None)
 def _database_url() -> str:
+    # Resolved once per process; a missing URL raises and is looked up again next call.
     url = os.getenv("DATABASE_URL", "").strip()
     if url:
         return url
@@ -39,6 +62,24 @@ def _database_url() -> str:
     raise RuntimeError("DATABASE_URL is not set (env/.env/.streamlit/secrets.toml).")
 
 
+def _setting(name: str, default: str = "") -> str:
+    value = os.getenv(name, "").strip()
+    if value:
+        return value
+
+    try:
+        if name in st.secrets:
+            return str(st.secrets[name]).strip()
+    except Exception:
+        pass
+
+    return default
+
+
+def _flag(name: str, default: bool = False) -> bool:
+    return _setting(name, "1" if default else "0").lower() in {"1", "true", "yes", "on"}
+
+
 def is_configured() -> bool:
     try:
         _database_url()
@@ -47,17 +88,136 @@ def is_configured() -> bool:
         return False
 
 
+def _behind_pooler(conninfo: dict[str, Any]) -> bool:
+    # Neon's pooled endpoints (ep-...-pooler.<region>...) run PgBouncer in
+    # transaction mode: consecutive transactions may land on different server
+    # connections, and startup options are not forwarded.
+    return "-pooler" in str(conninfo.get("host") or "")
+
+
+def _prepare_threshold(pooled: bool) -> int | None:
+    # psycopg prepares a statement server-side after it has run this many times
+    # on a connection; None turns preparing off. Behind PgBouncer a prepared
+    # statement only works if the pooler tracks it (max_prepared_statements),
+    # so preparing is off there unless DB_PREPARE_THRESHOLD asks for it.
+    value = _setting("DB_PREPARE_THRESHOLD").lower()
+    if value in {"none", "off", "-1"}:
+        return None
+    if value:
+        return int(value)
+    return None if pooled else 5
+
+
+def _statement_timeout_dropped(conninfo: dict[str, Any]) -> bool:
+    # DB_STATEMENT_TIMEOUT travels as a startup option, which PgBouncer does
+    # not forward; behind a -pooler host it has to be set on the role instead.
+    return bool(_setting("DB_STATEMENT_TIMEOUT")) and _behind_pooler(conninfo)
+
+
+def statement_timeout_dropped() -> bool:
+    return _statement_timeout_dropped(conninfo_to_dict(_database_url()))
+
+
+def _pool_kwargs(conninfo: dict[str, Any]) -> dict[str, Any]:
+    pooled = _behind_pooler(conninfo)
+    kwargs: dict[str, Any] = {"prepare_threshold": _prepare_threshold(pooled)}
+    statement_timeout = _setting("DB_STATEMENT_TIMEOUT")
+    if statement_timeout and not pooled:
+        # Appended to any options already in the URL (Neon puts endpoint=... there).
+        options = str(conninfo.get("options") or "")
+        kwargs["options"] = f"{options} -c statement_timeout={statement_timeout.replace(' ', '')}".strip()
+    return kwargs
+
+
 @st.cache_resource
 def _pool() -> ConnectionPool:
-    return ConnectionPool(conninfo=_database_url(), min_size=1, max_size=5, open=True)
+    url = _database_url()
+    if _statement_timeout_dropped(conninfo_to_dict(url)):
+        _logger.warning(
+            "DB_STATEMENT_TIMEOUT is not applied behind a -pooler host; "
+            "set it on the role instead: alter role <user> set statement_timeout = '%s'",
+            _setting("DB_STATEMENT_TIMEOUT"),
+        )
+    _query_stats.configure(
+        enabled=_flag("DB_QUERY_STATS", True),
+        slow_ms=float(_setting("DB_SLOW_QUERY_MS", "500")),
+        explain=_flag("DB_SLOW_QUERY_EXPLAIN"),
+    )
+    return ConnectionPool(
+        conninfo=url,
+        kwargs=_pool_kwargs(conninfo_to_dict(url)),
+        min_size=int(_setting("DB_POOL_MIN_SIZE", "1")),
+        max_size=int(_setting("DB_POOL_MAX_SIZE", "5")),
+        timeout=float(_setting("DB_POOL_TIMEOUT", "10")),
+        max_idle=float(_setting("DB_POOL_MAX_IDLE", "300")),
+        max_lifetime=float(_setting("DB_POOL_MAX_LIFETIME", "1800")),
+        check=ConnectionPool.check_connection,
+        configure=_configure_connection,
+        name="bootcampx",
+        open=True,
+    )
+
+
+def _configure_connection(conn: psycopg.Connection[Any]) -> None:
+    if conn.prepare_threshold is not None and _flag("DB_PREPARE_HOT", True):
+        _prepare_hot_statements(conn)
+    if _query_stats.enabled:
+        conn.cursor_factory = _TimedCursor
+
+
+def _prepare(conn: psycopg.Connection[Any]) -> bool | None:
+    # prepare= for hot statements: prepared on first use (again after a
+    # rollback drops them), unless preparing is off for the pool.
+    return None if conn.prepare_threshold is None else True
+
+
+class _Latencies:
+    # Rolling window of recent samples, shared by every session in the process.
+    def __init__(self, size: int = 1000) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, ms: float) -> None:
+        with self._lock:
+            self._samples.append(ms)
+
+    def summary(self) -> dict[str, float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": 0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        return {
+            "count": len(samples),
+            "p50": samples[len(samples) // 2],
+            "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            "max": samples[-1],
+        }
+
+
+_checkout_ms = _Latencies()
 
 
 @contextmanager
 def get_connection() -> Iterable[psycopg.Connection[Any]]:
+    # Checkout time covers queueing for a free connection plus the health check.
+    started = time.perf_counter()
     with _pool().connection() as conn:
+        _checkout_ms.add((time.perf_counter() - started) * 1000)
         yield conn
 
 
+def pool_stats() -> dict[str, Any]:
+    # psycopg_pool counters (requests_waiting, requests_wait_ms, requests_errors
+    # for checkout timeouts, connections_errors, connections_lost, ...) are
+    # cumulative since the pool opened; checkout_ms is over the last 1000 checkouts.
+    pool = _pool()
+    return {
+        **pool.get_stats(),
+        "checkout_ms": _checkout_ms.summary(),
+        "prepare_threshold": pool.kwargs.get("prepare_threshold"),
+    }
+
+
 @contextmanager
 def transaction() -> Iterable[psycopg.Connection[Any]]:
     with get_connection() as conn:
@@ -69,12 +229,447 @@ def transaction() -> Iterable[psycopg.Connection[Any]]:
             raise
 
 
-def query_df(sql: str, params: tuple[Any, ...] | None = None) -> pd.DataFrame:
+# Latency histogram buckets: upper bounds from 0.1 ms to ~100 s, about 19% apart.
+_LATENCY_BOUNDS = [0.1 * 2 ** (i / 4) for i in range(81)]
+
+
+class _Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(_LATENCY_BOUNDS) + 1)
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float, rows: int, failed: bool) -> None:
+        self.counts[bisect.bisect_left(_LATENCY_BOUNDS, ms)] += 1
+        self.calls += 1
+        self.errors += failed
+        self.rows += max(rows, 0)
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th sample, capped at the max seen.
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(_LATENCY_BOUNDS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+
+class _QueryStats:
+    # Per (page, statement) latency histograms plus a short slow-query log,
+    # shared by every session in the process. Recording is a dict lookup and a
+    # bisect under a lock; the calling page is found by walking the stack.
+    def __init__(self) -> None:
+        self.enabled = True
+        self.slow_ms = 500.0
+        self.explain = False
+        self.slow: deque[dict[str, Any]] = deque(maxlen=50)
+        self._histograms: dict[tuple[str, str], _Histogram] = {}
+        self._pages: dict[str, str | None] = {}
+        self._explaining: set[str] = set()
+        self._lock = threading.Lock()
+
+    def configure(self, *, enabled: bool, slow_ms: float, explain: bool) -> None:
+        self.enabled, self.slow_ms, self.explain = enabled, slow_ms, explain
+
+    def _page_of(self, filename: str) -> str | None:
+        page = self._pages.get(filename, "")
+        if page == "":
+            path = os.path.normpath(filename)
+            if os.path.basename(os.path.dirname(path)) == "pages":
+                page = os.path.splitext(os.path.basename(path))[0].split("_", 1)[-1]
+            elif os.path.basename(path) == "app.py":
+                page = "Home"
+            else:
+                page = None
+            self._pages[filename] = page
+        return page
+
+    def caller(self) -> str:
+        frame = sys._getframe(2)
+        while frame is not None:
+            page = self._page_of(frame.f_code.co_filename)
+            if page:
+                return page
+            frame = frame.f_back
+        return "(background)"
+
+    def record(self, query: str, params: Any, ms: float, rows: int, failed: bool) -> None:
+        if not query.strip():
+            return  # the pool's health check
+        page = _query_page.get() or self.caller()
+        with self._lock:
+            histogram = self._histograms.get((page, query))
+            if histogram is None:
+                histogram = self._histograms[(page, query)] = _Histogram()
+            histogram.add(ms, rows, failed)
+        if ms >= self.slow_ms and not failed:
+            entry = {"at": datetime.now(), "page": page, "ms": ms, "rows": rows, "sql": query, "plan": None}
+            self.slow.appendleft(entry)
+            if self.explain and query.split(None, 1)[0].lower() in {"select", "with"}:
+                self._explain(entry, params)
+
+    def _explain(self, entry: dict[str, Any], params: Any) -> None:
+        # Re-runs the statement under EXPLAIN (ANALYZE, BUFFERS) on another pool
+        # connection, in a read-only transaction that is rolled back, so a
+        # data-modifying CTE fails instead of writing twice. At most one capture
+        # per statement runs at a time, off the page's thread.
+        with self._lock:
+            if entry["sql"] in self._explaining:
+                return
+            self._explaining.add(entry["sql"])
+
+        def run() -> None:
+            try:
+                with _pool().connection() as conn:
+                    try:
+                        with psycopg.Cursor(conn) as cur:
+                            cur.execute("set transaction read only")
+                            cur.execute("explain (analyze, buffers) " + entry["sql"], params)
+                            entry["plan"] = "\n".join(row[0] for row in cur.fetchall())
+                    finally:
+                        conn.rollback()
+            except Exception as exc:
+                entry["plan"] = f"EXPLAIN failed: {error_message(exc)}"
+            finally:
+                with self._lock:
+                    self._explaining.discard(entry["sql"])
+
+        threading.Thread(target=run, name="explain-slow-query", daemon=True).start()
+
+    def summary(self) -> pd.DataFrame:
+        with self._lock:
+            rows = [
+                {
+                    "page": page,
+                    "statement": " ".join(query.split()),
+                    "calls": h.calls,
+                    "errors": h.errors,
+                    "rows": h.rows,
+                    "total_ms": round(h.total_ms, 1),
+                    "mean_ms": round(h.total_ms / h.calls, 2),
+                    "p50_ms": round(h.percentile(0.50), 2),
+                    "p95_ms": round(h.percentile(0.95), 2),
+                    "p99_ms": round(h.percentile(0.99), 2),
+                    "max_ms": round(h.max_ms, 2),
+                }
+                for (page, query), h in self._histograms.items()
+            ]
+        return pd.DataFrame(
+            rows,
+            columns=["page", "statement", "calls", "errors", "rows", "total_ms", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"],
+        ).sort_values("total_ms", ascending=False, ignore_index=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self.slow.clear()
+
+
+_query_stats = _QueryStats()
+
+# Page that started a query running on the async runner's thread, where the
+# stack no longer leads back to it.
+_query_page: ContextVar[str | None] = ContextVar("query_page", default=None)
+
+
+def _query_text(query: Any, cursor: psycopg.Cursor[Any] | psycopg.AsyncCursor[Any]) -> str:
+    return query if isinstance(query, str) else query.as_string(cursor) if hasattr(query, "as_string") else str(query)
+
+
+class _TimedAsyncCursor(psycopg.AsyncCursor):
+    # _TimedCursor for the async pool.
+    async def execute(self, query: Any, params: Any = None, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await super().execute(query, params, **kwargs)
+            failed = False
+            return result
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            _query_stats.record(_query_text(query, self), params, ms, self.rowcount, failed)
+
+    @asynccontextmanager
+    async def copy(self, statement: Any, params: Any = None, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        failed = True
+        try:
+            async with super().copy(statement, params, **kwargs) as copy:
+                yield copy
+            failed = False
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            _query_stats.record(_query_text(statement, self), params, ms, self.rowcount, failed)
+
+
+class _TimedCursor(psycopg.Cursor):
+    # Cursor for pool connections that reports every execute() to _query_stats.
+    # rowcount is known once execute() returns, so nothing is added per fetch.
+    # A COPY is timed over the whole with block, since its data moves there.
+    def execute(self, query: Any, params: Any = None, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(query, params, **kwargs)
+            failed = False
+            return result
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            _query_stats.record(_query_text(query, self), params, ms, self.rowcount, failed)
+
+    @contextmanager
+    def copy(self, statement: Any, params: Any = None, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        failed = True
+        try:
+            with super().copy(statement, params, **kwargs) as copy:
+                yield copy
+            failed = False
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            _query_stats.record(_query_text(statement, self), params, ms, self.rowcount, failed)
+
+
+def query_stats() -> pd.DataFrame:
+    return _query_stats.summary()
+
+
+def slow_queries() -> list[dict[str, Any]]:
+    return list(_query_stats.slow)
+
+
+def reset_query_stats() -> None:
+    _query_stats.reset()
+
+
+class SaleRejected(Exception):
+    def __init__(self, message: str, line: int | None = None) -> None:
+        super().__init__(message)
+        self.message = message
+        self.line = line
+
+
+def error_message(exc: BaseException) -> str:
+    return getattr(getattr(exc, "diag", None), "message_primary", None) or str(exc)
+
+
+_NUMERIC_OID = 1700
+_TIMESTAMPTZ_OID = 1184
+_ARROW_BATCH_ROWS = 100_000
+
+# Postgres type OID -> Arrow type for columns pyarrow should not have to infer.
+_ARROW_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(),
+    21: pa.int64(),
+    23: pa.int64(),
+    25: pa.string(),
+    700: pa.float64(),
+    701: pa.float64(),
+    1043: pa.string(),
+    1082: pa.date32(),
+    1114: pa.timestamp("us"),
+}
+
+# Targets accepted in a query_df schema. "decimal" keeps the column's
+# NUMERIC(p, s) and "timestamp" its own timestamp type (see _arrow_type).
+_SCHEMA_TYPES = {
+    "bool": pa.bool_(),
+    "date": pa.date32(),
+    "decimal": None,
+    "float64": pa.float64(),
+    "int64": pa.int64(),
+    "string": pa.string(),
+    "timestamp": None,
+}
+
+
+def _session_timezone(conn: psycopg.Connection[Any] | psycopg.AsyncConnection[Any]) -> str:
+    # The connection's TimeZone as an Arrow time zone name (psycopg falls back
+    # to UTC for zones Python does not know).
+    return getattr(conn.info.timezone, "key", "UTC")
+
+
+def _arrow_type(column: psycopg.Column, timezone: str) -> pa.DataType | None:
+    # timestamptz keeps the session TimeZone, as psycopg's datetimes and
+    # sold_at::date do, so frames show local times rather than UTC.
+    if column.type_code == _NUMERIC_OID:
+        if column.precision is not None and column.scale is not None:
+            return pa.decimal128(column.precision, column.scale)
+        return None
+    if column.type_code == _TIMESTAMPTZ_OID:
+        return pa.timestamp("us", tz=timezone)
+    return _ARROW_TYPES.get(column.type_code)
+
+
+def _arrow_chunk(column: psycopg.Column, values: tuple[Any, ...], timezone: str) -> pa.Array:
+    if column.type_code == _NUMERIC_OID:
+        # Loaded as text (see query_df); Arrow parses it without building Decimals.
+        return pa.array(values, type=pa.string())
+    arrow_type = _arrow_type(column, timezone)
+    if arrow_type is None:
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+    return pa.array(values, type=arrow_type)
+
+
+def _arrow_column(
+    column: psycopg.Column, chunks: list[pa.Array], target: pa.DataType | None, timezone: str
+) -> pa.Array:
+    array = pa.concat_arrays(chunks) if chunks else _arrow_chunk(column, (), timezone)
+    if column.type_code == _NUMERIC_OID:
+        numeric_type = target or _arrow_type(column, timezone)
+        if numeric_type is None:
+            # Unconstrained NUMERIC (sum(), avg() ...): let Arrow pick precision and scale.
+            return pa.array([None if v is None else Decimal(v) for v in array.to_pylist()])
+        return array.cast(numeric_type)
+    if target is not None and array.type != target:
+        return array.cast(target)
+    return array
+
+
+class _ArrowFrame:
+    # Collects fetched batches column by column and builds the Arrow-backed frame.
+    def __init__(self, description: list[psycopg.Column], schema: dict[str, str], timezone: str) -> None:
+        self._description = description
+        self._schema = schema
+        self._timezone = timezone
+        self._chunks: list[list[pa.Array]] = [[] for _ in description]
+
+    def add(self, rows: list[tuple[Any, ...]]) -> None:
+        for column, column_chunks, values in zip(self._description, self._chunks, zip(*rows)):
+            column_chunks.append(_arrow_chunk(column, values, self._timezone))
+
+    def frame(self) -> pd.DataFrame:
+        arrays = [
+            _arrow_column(
+                column,
+                column_chunks,
+                _SCHEMA_TYPES[self._schema[column.name]] if column.name in self._schema else None,
+                self._timezone,
+            )
+            for column, column_chunks in zip(self._description, self._chunks)
+        ]
+        table = pa.Table.from_arrays(arrays, names=[column.name for column in self._description])
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def query_df(
+    sql: str,
+    params: tuple[Any, ...] | None = None,
+    *,
+    schema: dict[str, str] | None = None,
+) -> pd.DataFrame:
+    # Rows are fetched as tuples and paired with the column names. With a schema
+    # every column becomes Arrow-backed, typed from the Postgres column type or
+    # from the schema entry (see _SCHEMA_TYPES). NUMERIC is read as text and
+    # parsed by Arrow, and rows are converted in batches so only one batch of
+    # Python objects is alive at a time. Binary transfer was measured slower
+    # here, since binary NUMERIC still decodes to Decimal. Without a schema the
+    # frame keeps Python objects.
+    #
+    # No explicit commit: the pool's connection() commits on a clean exit
+    # (which keeps the connection's prepared statements, unlike a rollback)
+    # and rolls back on error.
     with get_connection() as conn:
-        with conn.cursor(row_factory=dict_row) as cur:
+        with conn.cursor() as cur:
+            if schema is None:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+                return pd.DataFrame.from_records(rows, columns=[column.name for column in cur.description or []])
+
+            cur.adapters.register_loader("numeric", TextLoader)
             cur.execute(sql, params)
-            rows = cur.fetchall()
-    return pd.DataFrame(rows)
+            builder = _ArrowFrame(cur.description or [], schema, _session_timezone(conn))
+            while rows := cur.fetchmany(_ARROW_BATCH_ROWS):
+                builder.add(rows)
+    return builder.frame()
+
+
+@dataclass(frozen=True)
+class Query:
+    sql: str
+    params: tuple[Any, ...] | None = None
+    schema: dict[str, str] | None = None
+
+
+class _AsyncRunner:
+    # An event loop on its own thread, owning an AsyncConnectionPool. Pages stay
+    # synchronous and hand it coroutines; a batch of independent queries then
+    # waits for the slowest one instead of the sum of all of them.
+    def __init__(self, url: str) -> None:
+        # A selector loop: psycopg's async connections cannot use Windows' proactor loop.
+        self.loop = asyncio.SelectorEventLoop()
+        threading.Thread(target=self.loop.run_forever, name="bootcampx-async", daemon=True).start()
+        self.pool = AsyncConnectionPool(
+            conninfo=url,
+            kwargs=_pool_kwargs(conninfo_to_dict(url)),
+            min_size=int(_setting("DB_ASYNC_POOL_MIN_SIZE", "0")),
+            max_size=int(_setting("DB_ASYNC_POOL_MAX_SIZE", "4")),
+            timeout=float(_setting("DB_POOL_TIMEOUT", "10")),
+            max_idle=float(_setting("DB_POOL_MAX_IDLE", "300")),
+            max_lifetime=float(_setting("DB_POOL_MAX_LIFETIME", "1800")),
+            check=AsyncConnectionPool.check_connection,
+            configure=_configure_async_connection,
+            name="bootcampx-async",
+            open=False,
+        )
+        self.run(self.pool.open())
+
+    def run(self, coro: Awaitable[Any]) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+@st.cache_resource
+def _async_runner() -> _AsyncRunner:
+    _pool()  # applies the query statistics settings
+    return _AsyncRunner(_database_url())
+
+
+async def _configure_async_connection(conn: psycopg.AsyncConnection[Any]) -> None:
+    if _query_stats.enabled:
+        conn.cursor_factory = _TimedAsyncCursor
+
+
+async def query_df_async(
+    sql: str,
+    params: tuple[Any, ...] | None = None,
+    *,
+    schema: dict[str, str] | None = None,
+) -> pd.DataFrame:
+    # query_df on the async pool; must be awaited on the runner's loop.
+    async with _async_runner().pool.connection() as conn:
+        async with conn.cursor() as cur:
+            if schema is None:
+                await cur.execute(sql, params)
+                rows = await cur.fetchall()
+                return pd.DataFrame.from_records(rows, columns=[column.name for column in cur.description or []])
+
+            cur.adapters.register_loader("numeric", TextLoader)
+            await cur.execute(sql, params)
+            builder = _ArrowFrame(cur.description or [], schema, _session_timezone(conn))
+            while rows := await cur.fetchmany(_ARROW_BATCH_ROWS):
+                builder.add(rows)
+    return builder.frame()
+
+
+def query_dfs(queries: Sequence[Query]) -> list[pd.DataFrame]:
+    # Runs independent read queries concurrently, each on its own async pool
+    # connection, and returns their frames in order. They do not share a
+    # snapshot, so only batch queries that need not agree with each other.
+    page = _query_stats.caller()
+
+    async def gather() -> list[pd.DataFrame]:
+        _query_page.set(page)  # the tasks copy this context
+        return await asyncio.gather(*(query_df_async(q.sql, q.params, schema=q.schema) for q in queries))
+
+    return _async_runner().run(gather())
 
 
 def execute(
@@ -94,9 +689,52 @@ def execute(
             return None
 
 
-@st.cache_data(ttl=60)
-def active_cashiers_df() -> pd.DataFrame:
-    return query_df(
+@dataclass(frozen=True)
+class Lookup:
+    df: pd.DataFrame
+    rows: dict[int, dict[str, Any]]
+    labels: dict[int, str]
+    by_code: dict[str, int] = field(default_factory=dict)
+
+
+def cashier_label(row: dict[str, Any]) -> str:
+    username = row["username"]
+    suffix = f" (@{username})" if username else ""
+    return f"{row['full_name']}{suffix}"
+
+
+def item_label(row: dict[str, Any]) -> str:
+    extras = " • ".join([x for x in [row["sku"] or "", row["barcode"] or ""] if x])
+    suffix = f" ({extras})" if extras else ""
+    return f"{row['item_name']}{suffix}"
+
+
+def _lookup(df: pd.DataFrame, key: str, label: Callable[[dict[str, Any]], str]) -> Lookup:
+    # Missing values become None so rows behave the same on every pandas version.
+    records = df.astype(object).where(df.notna(), None).to_dict("records")
+    rows = {int(row[key]): row for row in records}
+    return Lookup(df=df, rows=rows, labels={k: label(row) for k, row in rows.items()})
+
+
+# The change listener drops these caches as soon as a table changes; the TTL
+# only bounds staleness while the listener is disconnected or turned off.
+_CACHE_TTL = int(_setting("CACHE_TTL_SECONDS", "600"))
+
+# With STOCK_LEDGER=1 (see schema.ensure_stock_ledger) stock is read from, and
+# edited through, the items_on_hand view: the posted balance in items plus
+# the stock movements not yet compacted into it.
+_STOCK_LEDGER = _flag("STOCK_LEDGER")
+_ITEMS = "items_on_hand" if _STOCK_LEDGER else "items"
+
+
+def stock_ledger_enabled() -> bool:
+    return _STOCK_LEDGER
+
+
+@st.cache_data(ttl=_CACHE_TTL)
+def active_cashiers() -> Lookup:
+    _change_listener()
+    df = query_df(
         """
         select cashier_id, full_name, username
         from cashiers
@@ -104,37 +742,1447 @@ def active_cashiers_df() -> pd.DataFrame:
         order by full_name
         """
     )
+    return _lookup(df, "cashier_id", cashier_label)
 
 
-@st.cache_data(ttl=60)
-def cashiers_index_df() -> pd.DataFrame:
-    return query_df(
+def active_cashiers_df() -> pd.DataFrame:
+    return active_cashiers().df
+
+
+@st.cache_data(ttl=_CACHE_TTL)
+def cashiers_index() -> Lookup:
+    _change_listener()
+    df = query_df(
         """
         select cashier_id, full_name, username, active, created_at
         from cashiers
         order by full_name
         """
     )
+    return _lookup(df, "cashier_id", cashier_label)
+
+
+def cashiers_index_df() -> pd.DataFrame:
+    return cashiers_index().df
+
+
+def clear_cashier_caches() -> None:
+    active_cashiers.clear()
+    cashiers_index.clear()
+
+
+_POS_CATALOG_COLUMNS = "item_id, item_name, sku, barcode, qty_on_hand, unit, sell_price, updated_at"
+
+# The Items page's list: every item, active or not.
+_ITEMS_INDEX_COLUMNS = "item_id, item_name, sku, barcode, qty_on_hand, unit, sell_price, active, created_at, updated_at"
+
+# Rows committed up to this long after their updated_at was stamped are still
+# picked up by the next delta; anything slower waits for the next full load.
+_CATALOG_SYNC_OVERLAP = "1 minute"
+
+
+def _pos_lookup(df: pd.DataFrame) -> Lookup:
+    catalog = _lookup(df, "item_id", item_label)
+    # Barcodes take precedence over SKUs when the same code is used for both.
+    for code_column in ("sku", "barcode"):
+        for item_id, row in catalog.rows.items():
+            code = row[code_column]
+            if code:
+                catalog.by_code[code] = item_id
+    return catalog
+
+
+def _sql_items_changed(columns: str) -> str:
+    if _STOCK_LEDGER:
+        # Sales no longer touch items, so stock changes are found in the ledger.
+        return f"""
+select {columns}
+from items_on_hand
+where item_id in (
+  select item_id from items where updated_at > %(since)s::timestamptz - interval '{_CATALOG_SYNC_OVERLAP}'
+  union
+  select item_id from stock_movements where not posted and moved_at > %(since)s::timestamptz - interval '{_CATALOG_SYNC_OVERLAP}'
+)
+"""
+    return f"""
+select {columns}
+from items
+where updated_at > %(since)s::timestamptz - interval '{_CATALOG_SYNC_OVERLAP}'
+"""
+
+
+_SQL_CATALOG_CHANGED = _sql_items_changed(f"{_POS_CATALOG_COLUMNS}, active")
+_SQL_ITEMS_INDEX_CHANGED = _sql_items_changed(_ITEMS_INDEX_COLUMNS)
+
+
+def _sql_with_watermark(query: str, order_by: str = "") -> str:
+    # Prefixes each row with the statement's own timestamp, the watermark for
+    # the next sync, so a load or delta costs one round trip. The left join
+    # still returns it, as a row of nulls, when the query matched nothing.
+    return f"""
+select w._watermark, q.*
+from (select statement_timestamp() as _watermark) w
+left join ({query}) q on true
+{order_by}
+"""
+
+
+_SQL_CATALOG_SYNC = _sql_with_watermark(_SQL_CATALOG_CHANGED)
+
+
+class _CatalogSync:
+    # An item catalog (the POS catalog, or the Items page's index), shared by
+    # every session and kept current incrementally. A full load happens at
+    # most once per CACHE_TTL_SECONDS; in between, a sync re-reads only the
+    # items whose updated_at moved since the last one. A local write marks the
+    # catalog stale and syncs it on the next get. A change notification only
+    # marks it notified: every sale notifies, so notified catalogs sync at
+    # most once per CATALOG_SYNC_SECONDS, as do catalogs that merely got that
+    # old when no listener delivers notifications (periodic=True). Merges are
+    # copy-on-write: readers keep the Lookup they were handed, so callers must
+    # treat it as read-only. The defaults describe the POS catalog; load_sql
+    # is left unordered, since loads are sorted by item_name around it.
+    def __init__(
+        self,
+        full_interval: float,
+        sync_interval: float,
+        *,
+        load_sql: str = f"select {_POS_CATALOG_COLUMNS} from {_ITEMS} where active is true",
+        changed_sql: str = _SQL_CATALOG_CHANGED,
+        build: Callable[[pd.DataFrame], Lookup] = _pos_lookup,
+        active_only: bool = True,
+    ) -> None:
+        self._full_interval = full_interval
+        self._sync_interval = sync_interval
+        self._load_sql = _sql_with_watermark(load_sql, "order by q.item_name")
+        self._sync_sql = _sql_with_watermark(changed_sql)
+        self._build = build
+        self._active_only = active_only
+        self._lock = threading.Lock()
+        self._catalog: Lookup | None = None
+        self._positions: dict[int, int] = {}
+        self._watermark: datetime | None = None
+        self._loaded_at = 0.0
+        self._synced_at = 0.0
+        self._stale = False
+        self._notified = False
+
+    def get(self, *, periodic: bool = True) -> Lookup:
+        catalog = self._catalog
+        if catalog is not None and not self._due(time.monotonic(), periodic):
+            return catalog
+        with self._lock:
+            now = time.monotonic()
+            if self._catalog is None or now - self._loaded_at >= self._full_interval:
+                self._load()
+            elif self._due(now, periodic):
+                self._sync()
+            return self._catalog
+
+    def _due(self, now: float, periodic: bool) -> bool:
+        return self._stale or ((self._notified or periodic) and now - self._synced_at >= self._sync_interval)
+
+    def mark_stale(self) -> None:
+        self._stale = True
+
+    def notify(self) -> None:
+        self._notified = True
+
+    def reset(self) -> None:
+        self._loaded_at = 0.0
+
+    @staticmethod
+    def _query(sql: str, params: dict[str, Any] | None = None) -> tuple[datetime, pd.DataFrame]:
+        # Runs a _sql_with_watermark statement and splits off the watermark
+        # before the frame is built, as query_df would build it.
+        with transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+                columns = [column.name for column in cur.description or []][1:]
+        key = columns.index("item_id") + 1
+        records = [row[1:] for row in rows if row[key] is not None]
+        return rows[0][0], pd.DataFrame.from_records(records, columns=columns)
+
+    def _load(self) -> None:
+        self._stale = False
+        self._notified = False
+        watermark, df = self._query(self._load_sql)
+        self._publish(self._build(df))
+        self._watermark = watermark
+        self._loaded_at = self._synced_at = time.monotonic()
+
+    def _sync(self) -> None:
+        self._stale = False
+        self._notified = False
+        watermark, changed = self._query(self._sync_sql, {"since": self._watermark})
+        if not changed.empty:
+            self._merge(changed.astype(object).where(changed.notna(), None).to_dict("records"))
+        self._watermark = watermark
+        self._synced_at = time.monotonic()
+
+    def merge(self, rows: list[dict[str, Any]]) -> None:
+        with self._lock:
+            if self._catalog is not None:
+                self._merge(rows)
+
+    def _merge(self, rows: list[dict[str, Any]]) -> None:
+        # Each row is applied only if it is at least as new as the cached one,
+        # so overlapping deltas and post-sale patches never move a row backwards.
+        catalog = self._catalog
+        current = dict(catalog.rows)
+        patches: dict[int, dict[str, Any]] = {}
+        reshaped = False
+        for row in rows:
+            item_id = int(row["item_id"])
+            old = current.get(item_id)
+            if old is not None and old["updated_at"] is not None and row["updated_at"] < old["updated_at"]:
+                continue
+            if old is None and not set(catalog.df.columns) <= row.keys():
+                continue  # a stock patch for an item the catalog does not hold
+            if self._active_only and row.get("active", True) is False:
+                reshaped |= current.pop(item_id, None) is not None
+                continue
+            new = {**(old or {}), **{k: v for k, v in row.items() if k in catalog.df.columns}}
+            if new == old:
+                continue
+            current[item_id] = new
+            patches[item_id] = new
+            if old is None or any(new[k] != old[k] for k in ("item_name", "sku", "barcode")):
+                reshaped = True
+
+        if reshaped:
+            # Membership, order or codes changed: rebuild the frame from the rows.
+            ordered = sorted(current.values(), key=lambda r: (str(r["item_name"]).casefold(), r["item_id"]))
+            self._publish(self._build(pd.DataFrame.from_records(ordered, columns=catalog.df.columns)))
+        elif patches:
+            # Only stock, price, unit or the like moved: patch those cells in a
+            # copy of the frame.
+            df = catalog.df.copy()
+            for item_id, new in patches.items():
+                position = self._positions[item_id]
+                old = catalog.rows[item_id]
+                for column in df.columns:
+                    if new[column] != old[column]:
+                        df.iat[position, df.columns.get_loc(column)] = new[column]
+            self._catalog = Lookup(df=df, rows=current, labels=catalog.labels, by_code=catalog.by_code)
+
+    def _publish(self, catalog: Lookup) -> None:
+        self._positions = {item_id: position for position, item_id in enumerate(catalog.df["item_id"].tolist())}
+        self._catalog = catalog
+
+
+@st.cache_resource
+def _catalog_sync() -> _CatalogSync:
+    return _CatalogSync(float(_CACHE_TTL), float(_setting("CATALOG_SYNC_SECONDS", "30")))
+
+
+def _notifications_live() -> bool:
+    # While the listener is connected, catalogs sync on notifications rather
+    # than on age alone.
+    listener = _change_listener()
+    return listener is not None and listener.listening
+
+
+def pos_catalog() -> Lookup:
+    return _catalog_sync().get(periodic=not _notifications_live())
 
 
-@st.cache_data(ttl=60)
 def active_items_for_pos_df() -> pd.DataFrame:
-    return query_df(
-        """
-        select item_id, item_name, sku, barcode, qty_on_hand, unit, sell_price
-        from items
-        where active is true
-        order by item_name
-        """
+    return pos_catalog().df
+
+
+def apply_sale_stock(receipts: Sequence[dict[str, Any]]) -> None:
+    # Patch the sold items' stock from the receipt rows instead of reloading the
+    # catalog. Receipts without stock (fast_sale reads items before the stock
+    # trigger runs) just mark the catalog stale for the next delta.
+    rows = [
+        {"item_id": r["item_id"], "qty_on_hand": r["qty_on_hand"], "updated_at": r["item_updated_at"]}
+        for r in receipts
+        if r.get("item_updated_at") is not None
+    ]
+    for sync in (_catalog_sync(), _items_index_sync()):
+        if len(rows) < len(receipts):
+            sync.mark_stale()
+        if rows:
+            sync.merge(rows)
+
+
+_SQL_FIND_POS_ITEM = f"""
+select {_POS_CATALOG_COLUMNS}
+from {_ITEMS}
+where active is true and (barcode = %s or sku = %s)
+limit 1
+"""
+
+
+def find_pos_item(code: str) -> int | None:
+    code = code.strip()
+    if not code:
+        return None
+
+    item_id = pos_catalog().by_code.get(code)
+    if item_id is not None:
+        return item_id
+
+    # Miss: the item may have been created or activated since the last sync.
+    found = query_df(_SQL_FIND_POS_ITEM, (code, code))
+    if found.empty:
+        return None
+    _catalog_sync().merge(found.astype(object).where(found.notna(), None).to_dict("records"))
+    return int(found.loc[0, "item_id"])
+
+
+@st.cache_resource
+def _items_index_sync() -> _CatalogSync:
+    return _CatalogSync(
+        float(_CACHE_TTL),
+        float(_setting("CATALOG_SYNC_SECONDS", "30")),
+        load_sql=f"select {_ITEMS_INDEX_COLUMNS} from {_ITEMS}",
+        changed_sql=_SQL_ITEMS_INDEX_CHANGED,
+        build=lambda df: _lookup(df, "item_id", item_label),
+        active_only=False,
     )
 
 
-@st.cache_data(ttl=60)
+def items_index() -> Lookup:
+    # Kept current like the POS catalog (see _CatalogSync); read-only.
+    return _items_index_sync().get(periodic=not _notifications_live())
+
+
 def items_index_df() -> pd.DataFrame:
+    return items_index().df
+
+
+def clear_item_caches() -> None:
+    # Both item catalogs re-read the changed items on their next use.
+    _catalog_sync().mark_stale()
+    _items_index_sync().mark_stale()
+
+
+# Columns the bulk editor may change, with their Postgres array types.
+_EDITABLE_ITEM_COLUMNS = {
+    "item_name": "text",
+    "sku": "text",
+    "barcode": "text",
+    "unit": "text",
+    "qty_on_hand": "numeric",
+    "sell_price": "numeric",
+    "active": "boolean",
+}
+
+
+def _sql_update_items() -> str:
+    # For every editable column the statement gets three arrays: the new value,
+    # the value the editor started from, and whether the cell changed. Only
+    # changed cells are written, and only if they still hold the starting value,
+    # so a sale that moves qty_on_hand meanwhile is not overwritten by a price edit.
+    names = list(_EDITABLE_ITEM_COLUMNS)
+    arrays = ", ".join(
+        f"%s::{kind}[], %s::{kind}[], %s::boolean[]" for kind in _EDITABLE_ITEM_COLUMNS.values()
+    )
+    aliases = ", ".join(f"new_{name}, old_{name}, set_{name}" for name in names)
+    assignments = ",\n    ".join(
+        f"{name} = case when v.set_{name} then v.new_{name} else i.{name} end" for name in names
+    )
+    guards = "\n  and ".join(f"(not v.set_{name} or i.{name} is not distinct from v.old_{name})" for name in names)
+    return f"""
+update {_ITEMS} i
+set {assignments}
+from unnest(%s::bigint[], {arrays}) as v(item_id, {aliases})
+where i.item_id = v.item_id
+  and {guards}
+returning i.item_id
+"""
+
+
+_SQL_UPDATE_ITEMS = _sql_update_items()
+
+
+def update_items(changes: Sequence[tuple[int, str, Any, Any]]) -> list[int]:
+    # changes are (item_id, column, old value, new value) cells from the bulk
+    # editor; every changed item is written by one statement in one transaction.
+    # Returns the ids of items that were not updated because someone else
+    # changed one of the edited cells first.
+    by_item: dict[int, dict[str, tuple[Any, Any]]] = {}
+    for item_id, column, old, new in changes:
+        if column not in _EDITABLE_ITEM_COLUMNS:
+            raise ValueError(f"Column {column} cannot be edited.")
+        by_item.setdefault(int(item_id), {})[column] = (old, new)
+    if not by_item:
+        return []
+
+    item_ids = list(by_item)
+    params: list[Any] = [item_ids]
+    for name in _EDITABLE_ITEM_COLUMNS:
+        cells = [by_item[item_id].get(name) for item_id in item_ids]
+        params.append([cell[1] if cell else None for cell in cells])
+        params.append([cell[0] if cell else None for cell in cells])
+        params.append([cell is not None for cell in cells])
+
+    with transaction() as conn:
+        updated = {row[0] for row in conn.execute(_SQL_UPDATE_ITEMS, params).fetchall()}
+    return [item_id for item_id in item_ids if item_id not in updated]
+
+
+def update_item(
+    item_id: int,
+    *,
+    item_name: str,
+    sku: str | None,
+    barcode: str | None,
+    unit: str,
+    qty_on_hand: Decimal,
+    sell_price: Decimal,
+    active: bool,
+) -> None:
+    execute(
+        f"""
+        update {_ITEMS}
+        set item_name = %s,
+            sku = %s,
+            barcode = %s,
+            unit = %s,
+            qty_on_hand = %s,
+            sell_price = %s,
+            active = %s
+        where item_id = %s
+        """,
+        (item_name, sku, barcode, unit, qty_on_hand, sell_price, active, int(item_id)),
+    )
+
+
+# Prices come from items in the same statement, so lines whose item is
+# inactive or gone insert nothing (and a cart of unknown ids is a no-op).
+#
+# Every insert into sales writes its rows in item_id order. prevent_oversell
+# locks each line's items row as the row is inserted, so carts sharing items
+# then take those locks in one global order and cannot deadlock. Callers map
+# rows back to cart lines by item_id.
+_SQL_INSERT_CART = """
+insert into sales (cashier_id, item_id, qty, unit_price)
+select %s, l.item_id, l.qty, i.sell_price
+from unnest(%s::bigint[], %s::numeric[]) as l(item_id, qty)
+join items i on i.item_id = l.item_id and i.active is true
+order by l.item_id
+returning sale_id, item_id, sold_at
+"""
+
+_SQL_INSERT_SALES = """
+insert into sales (cashier_id, item_id, qty, unit_price)
+select %s, l.item_id, l.qty, l.unit_price
+from unnest(%s::bigint[], %s::numeric[], %s::numeric[]) as l(item_id, qty, unit_price)
+order by l.item_id
+returning sale_id
+"""
+
+_SQL_RECEIPT = f"""
+select
+  s.sale_id, s.sold_at,
+  c.full_name as cashier,
+  i.item_name, i.unit,
+  s.qty, s.unit_price, s.line_total,
+  s.item_id, i.qty_on_hand, i.updated_at as item_updated_at
+from unnest(%s::bigint[]) with ordinality as r(sale_id, line_no)
+join sales s on s.sale_id = r.sale_id and s.sold_at = %s
+join cashiers c on c.cashier_id = s.cashier_id
+join {_ITEMS} i on i.item_id = s.item_id
+order by r.line_no
+"""
+
+
+def record_sales(cashier_id: int, lines: Sequence[tuple[int, Any]]) -> list[dict[str, Any]]:
+    if not lines:
+        raise ValueError("Cart is empty.")
+    # After-row triggers fire at the end of the insert statement, so two rows for
+    # the same item would both be checked against the pre-sale stock. Merge them.
+    merged: dict[int, Any] = {}
+    for item_id, qty in lines:
+        merged[int(item_id)] = merged[int(item_id)] + qty if int(item_id) in merged else qty
+    # Int8 keeps the parameter types (part of psycopg's prepared statement key)
+    # the same whatever the ids' magnitude; see _prepare_hot_statements.
+    item_ids = [Int8(item_id) for item_id in merged]
+    qtys = list(merged.values())
+
+    try:
+        with transaction() as conn:
+            prepare = _prepare(conn)
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(_SQL_INSERT_CART, (Int8(cashier_id), item_ids, qtys), prepare=prepare)
+                rows = cur.fetchall()
+                sold = {row["item_id"]: row["sale_id"] for row in rows}
+                for line, item_id in enumerate(item_ids, start=1):
+                    if item_id not in sold:
+                        raise SaleRejected("Item is not active or no longer exists.", line=line)
+
+                # Receipt lines follow the cart, not the insert order. The
+                # lines share one sold_at (the transaction's now()), which
+                # narrows a partitioned sales to the month being sold in.
+                cur.execute(
+                    _SQL_RECEIPT,
+                    ([Int8(sold[item_id]) for item_id in item_ids], rows[0]["sold_at"]),
+                    prepare=prepare,
+                )
+                return cur.fetchall()
+    except psycopg.errors.RaiseException as exc:
+        line, message = _locate_rejected_line(cashier_id, item_ids, qtys)
+        raise SaleRejected(message or error_message(exc), line=line) from exc
+
+
+_SQL_LOCK_STOCK = """
+select pg_advisory_xact_lock(hashtext('bootcampx.stock'), k)
+from (select distinct hashint8(item_id) as k from unnest(%s::bigint[]) as item_id order by 1) as keys
+"""
+
+
+def _locate_rejected_line(
+    cashier_id: int,
+    item_ids: list[int],
+    qtys: list[Any],
+    unit_prices: list[Any] | None = None,
+) -> tuple[int | None, str | None]:
+    # Slow path, only taken after a rejected checkout: replay the basket line by
+    # line in a throwaway transaction so the trigger tells us which line failed.
+    with get_connection() as conn:
+        try:
+            return _replay_lines(conn, cashier_id, item_ids, qtys, unit_prices)
+        finally:
+            conn.rollback()
+
+
+# Errors a single sale line can raise: the oversell check, and bad or
+# conflicting values (a numeric overflow, a deleted item or cashier).
+_LINE_ERRORS = (psycopg.errors.RaiseException, psycopg.errors.DataError, psycopg.errors.IntegrityError)
+
+
+def _replay_lines(
+    conn: psycopg.Connection[Any],
+    cashier_id: int,
+    item_ids: list[int],
+    qtys: list[Any],
+    unit_prices: list[Any] | None = None,
+) -> tuple[int | None, str | None]:
+    # Runs inside a savepoint that is always rolled back, so it can also be
+    # used in the middle of a larger transaction. Without unit_prices the lines
+    # are priced from items, as record_sales does. Lines are replayed in
+    # item_id order, the order every sales insert locks items in (see
+    # _SQL_INSERT_CART), and reported by their cart line number.
+    with conn.transaction(force_rollback=True), conn.cursor() as cur:
+        if _STOCK_LEDGER:
+            # Take every line's stock lock up front, in the order the ledger
+            # trigger uses, so replaying line by line cannot deadlock.
+            cur.execute(_SQL_LOCK_STOCK, (item_ids,))
+        for line in sorted(range(1, len(item_ids) + 1), key=lambda n: item_ids[n - 1]):
+            item_id, qty = item_ids[line - 1], qtys[line - 1]
+            try:
+                if unit_prices is None:
+                    cur.execute(_SQL_INSERT_CART, (cashier_id, [item_id], [qty]))
+                    if cur.rowcount == 0:
+                        return line, "Item is not active or no longer exists."
+                else:
+                    cur.execute(_SQL_INSERT_SALES, (cashier_id, [item_id], [qty], [unit_prices[line - 1]]))
+            except _LINE_ERRORS as exc:
+                return line, error_message(exc)
+    return None, None
+
+
+_SQL_INSERT_QUEUED_SALES = """
+insert into sales (cashier_id, item_id, qty, unit_price, sold_at)
+select %s, l.item_id, l.qty, l.unit_price, %s
+from unnest(%s::bigint[], %s::numeric[], %s::numeric[]) as l(item_id, qty, unit_price)
+order by l.item_id
+returning sale_id
+"""
+
+
+_QUEUED_SALE_DEADLOCK_RETRIES = 3
+
+
+def record_queued_sales(sales: Sequence[dict[str, Any]]) -> dict[str, list[int] | SaleRejected]:
+    # Flushes sales confirmed offline by sale_queue. Each sale carries
+    # client_ref, cashier_id, sold_at and item_ids/qtys/unit_prices, the prices
+    # the customer was charged. queued_sale_refs makes the flush idempotent: a
+    # sale whose ref is already there was recorded by an earlier flush (or
+    # another app process) and is not inserted again.
+    #
+    # The batch shares one connection, but every sale commits on its own. A
+    # sale then holds its items' locks only while it is inserted, taken in
+    # item_id order like a checkout's (see _SQL_INSERT_CART), so a flush never
+    # holds locks in an order that could deadlock with checkouts or another
+    # process's flush, and never makes the tills wait for a whole batch. A
+    # rejection (oversell, or values the database refuses) only drops that
+    # sale; a sale that loses a deadlock anyway is retried.
+    results: dict[str, list[int] | SaleRejected] = {}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for sale in sales:
+                ref = sale["client_ref"]
+                for attempt in range(1, _QUEUED_SALE_DEADLOCK_RETRIES + 1):
+                    try:
+                        results[ref] = _record_queued_sale(conn, cur, sale)
+                    except psycopg.errors.DeadlockDetected:
+                        if attempt == _QUEUED_SALE_DEADLOCK_RETRIES:
+                            raise
+                        continue
+                    except _LINE_ERRORS as exc:
+                        line, message = _replay_lines(
+                            conn, sale["cashier_id"], sale["item_ids"], sale["qtys"], sale["unit_prices"]
+                        )
+                        results[ref] = SaleRejected(message or error_message(exc), line=line)
+                    break
+    return results
+
+
+def _record_queued_sale(conn: psycopg.Connection[Any], cur: psycopg.Cursor[Any], sale: dict[str, Any]) -> list[int]:
+    # One queued sale in its own transaction; returns its sale ids, or the ids
+    # stored with its ref when an earlier flush already recorded it.
+    ref = sale["client_ref"]
+    with conn.transaction():
+        cur.execute(
+            "insert into queued_sale_refs (client_ref) values (%s) on conflict do nothing returning client_ref",
+            (ref,),
+        )
+        if cur.fetchone() is None:
+            cur.execute("select sale_ids from queued_sale_refs where client_ref = %s", (ref,))
+            return cur.fetchone()[0]
+        cur.execute(
+            _SQL_INSERT_QUEUED_SALES,
+            (sale["cashier_id"], sale["sold_at"], sale["item_ids"], sale["qtys"], sale["unit_prices"]),
+        )
+        sale_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("update queued_sale_refs set sale_ids = %s where client_ref = %s", (sale_ids, ref))
+        return sale_ids
+
+
+_SQL_FAST_SALE = """
+with item as (
+  select item_id, sell_price
+  from items
+  where item_id = %s and active is true
+), sale as (
+  insert into sales (cashier_id, item_id, qty, unit_price)
+  select %s, item.item_id, %s, item.sell_price
+  from item
+  returning sale_id, sold_at, cashier_id, item_id, qty, unit_price, line_total
+)
+select
+  s.sale_id, s.sold_at,
+  c.full_name as cashier,
+  i.item_name, i.unit,
+  s.qty, s.unit_price, s.line_total,
+  s.item_id
+from sale s
+join cashiers c on c.cashier_id = s.cashier_id
+join items i on i.item_id = s.item_id
+"""
+
+
+def fast_sale_enabled() -> bool:
+    return _flag("FAST_SALE")
+
+
+def fast_sale(cashier_id: int, item_id: int, qty: Any) -> dict[str, Any]:
+    # Price check, insert and receipt projection in one round-trip. The statement
+    # is prepared on first use and reused for the lifetime of the connection,
+    # unless preparing is off for the pool (see _prepare_threshold).
+    try:
+        with transaction() as conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(_SQL_FAST_SALE, (Int8(item_id), Int8(cashier_id), qty), prepare=_prepare(conn))
+                receipt = cur.fetchone()
+    except psycopg.errors.RaiseException as exc:
+        raise SaleRejected(error_message(exc), line=1) from exc
+
+    if receipt is None:
+        raise SaleRejected("Item is not active or no longer exists.", line=1)
+    return receipt
+
+
+def _prepare_hot_statements(conn: psycopg.Connection[Any]) -> None:
+    # Runs once per new pool connection: every statement of the checkout path
+    # is prepared up front, with arguments that match no row, so the first sale
+    # on the connection is already a plain execute. psycopg keys prepared
+    # statements by query text and parameter types, hence the Int8 arguments
+    # here and on the hot path. The full catalog load is not included: it has
+    # no cheap no-op form and runs once per CACHE_TTL_SECONDS. One pipeline,
+    # so this costs about one round-trip; a failure (e.g. before
+    # schema.ensure() has run) only leaves the statements to be prepared later.
+    nothing = [Int8(0)]
+    never = datetime.max.replace(tzinfo=timezone.utc)
+    statements = [
+        (_SQL_FIND_POS_ITEM, ("", "")),
+        (_SQL_CATALOG_SYNC, {"since": never}),
+        (_SQL_INSERT_CART, (Int8(0), nothing, [Decimal(1)])),
+        (_SQL_RECEIPT, (nothing, never)),
+        (_SQL_FAST_SALE, (Int8(0), Int8(0), Decimal(1))),
+    ]
+    try:
+        with conn.pipeline(), conn.cursor() as cur:
+            for statement, params in statements:
+                cur.execute(statement, params, prepare=True)
+        conn.commit()
+    except psycopg.Error:
+        conn.rollback()
+
+
+class _SingleFlight:
+    # Process-wide value refreshed at most once per interval. Concurrent callers
+    # that find it stale queue on the lock and reuse the first caller's result.
+    def __init__(self, load: Callable[[], Any], interval: float) -> None:
+        self._load = load
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._value: Any = None
+        self._loaded_at = 0.0
+
+    def _fresh(self) -> bool:
+        return self._value is not None and time.monotonic() - self._loaded_at < self._interval
+
+    def get(self) -> Any:
+        if self._fresh():
+            return self._value
+        with self._lock:
+            if not self._fresh():
+                self._value = self._load()
+                self._loaded_at = time.monotonic()
+            return self._value
+
+
+@dataclass(frozen=True)
+class DashboardSnapshot:
+    taken_at: pd.Timestamp
+    kpi: pd.DataFrame
+    stock: pd.DataFrame
+    top_items: pd.DataFrame
+    trend: pd.DataFrame
+
+
+_SQL_DASHBOARD_KPI = """
+select
+  coalesce(sum(revenue) filter (where day = current_date), 0) as sales_today,
+  coalesce(sum(revenue), 0) as sales_month,
+  coalesce(sum(transactions) filter (where day = current_date), 0) as transactions_today
+from sales_daily_cashier
+where day >= date_trunc('month', current_date)
+"""
+
+_SQL_DASHBOARD_STOCK = f"""
+select item_name, sku, barcode, qty_on_hand, unit, sell_price
+from {_ITEMS}
+where active is true
+order by qty_on_hand asc, item_name asc
+"""
+
+_SQL_DASHBOARD_TOP_ITEMS = """
+select i.item_name, sum(d.revenue) as revenue
+from sales_daily d
+join items i on i.item_id = d.item_id
+where d.day >= date_trunc('month', current_date)
+group by i.item_name
+order by revenue desc
+limit 10
+"""
+
+_SQL_DASHBOARD_TREND = """
+select day, sum(revenue) as revenue
+from sales_daily_cashier
+where day >= current_date - 29
+group by day
+order by day
+"""
+
+
+def _load_dashboard() -> DashboardSnapshot:
+    _change_listener()
+    taken_at = pd.Timestamp.now()
+    kpi, stock, top_items, trend = query_dfs(
+        [
+            Query(_SQL_DASHBOARD_KPI),
+            Query(
+                _SQL_DASHBOARD_STOCK,
+                schema={"item_name": "string", "sku": "string", "barcode": "string", "unit": "string"},
+            ),
+            Query(_SQL_DASHBOARD_TOP_ITEMS, schema={"item_name": "string", "revenue": "decimal"}),
+            Query(_SQL_DASHBOARD_TREND, schema={"day": "date", "revenue": "decimal"}),
+        ]
+    )
+    if not trend.empty:
+        trend["day"] = pd.to_datetime(trend["day"])
+    return DashboardSnapshot(taken_at=taken_at, kpi=kpi, stock=stock, top_items=top_items, trend=trend)
+
+
+@st.cache_resource
+def _dashboard() -> _SingleFlight:
+    return _SingleFlight(_load_dashboard, float(_setting("DASHBOARD_REFRESH_SECONDS", "30")))
+
+
+def dashboard_snapshot() -> DashboardSnapshot:
+    # Shared by every session; callers must treat the frames as read-only.
+    return _dashboard().get()
+
+
+class _ChangeListener:
+    # Holds one dedicated connection LISTENing on bootcampx_changes (see
+    # schema.ensure_change_notify) and drops the caches fed by the table named
+    # in each notification. Notifications sent while disconnected are lost, so
+    # every cache is dropped whenever the connection is (re)established.
+    def __init__(self, conninfo: str) -> None:
+        self._conninfo = conninfo
+        self._listening = threading.Event()
+        self.events = 0
+        self.last_event: datetime | None = None
+        self.error: str | None = None
+
+    @property
+    def listening(self) -> bool:
+        return self._listening.is_set()
+
+    def start(self, wait: float = 5.0) -> None:
+        # Wait briefly for LISTEN so changes made while the first caches load are not missed.
+        threading.Thread(target=self._run, name="bootcampx-listen", daemon=True).start()
+        self._listening.wait(wait)
+
+    def _run(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                with psycopg.connect(self._conninfo, autocommit=True) as conn:
+                    conn.execute("listen bootcampx_changes")
+                    _invalidate_changed("*")
+                    self._listening.set()
+                    self.error = None
+                    delay = 1.0
+                    while True:
+                        for notify in conn.notifies(timeout=30):
+                            self.events += 1
+                            self.last_event = datetime.now()
+                            _invalidate_changed(notify.payload)
+                        conn.execute("select 1")  # notice a dead connection between notifications
+            except Exception as exc:
+                self._listening.clear()
+                self.error = error_message(exc)
+            time.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+
+def _invalidate_changed(table: str) -> None:
+    # Every sale notifies, so per-sale work is kept out of here: the Dashboard
+    # snapshot is left to expire on DASHBOARD_REFRESH_SECONDS, and the item
+    # catalogs, whose sold items the selling session already patched, are
+    # only marked notified (see _CatalogSync).
+    if table == "*":
+        _catalog_sync().reset()
+        _items_index_sync().reset()
+    if table in {"items", "stock_movements"}:
+        _catalog_sync().notify()
+        _items_index_sync().notify()
+    if table in {"cashiers", "*"}:
+        clear_cashier_caches()
+
+
+@st.cache_resource
+def _change_listener() -> _ChangeListener | None:
+    if not _flag("CACHE_LISTEN", True):
+        return None
+    # LISTEN needs a session-mode connection: PgBouncer in transaction mode
+    # (Neon's -pooler hosts) would hand the session to other clients.
+    conninfo = conninfo_to_dict(_database_url())
+    if conninfo.get("host"):
+        conninfo["host"] = str(conninfo["host"]).replace("-pooler.", ".")
+    listener = _ChangeListener(make_conninfo(**conninfo))
+    listener.start()
+    return listener
+
+
+def cache_listener_status() -> dict[str, Any]:
+    listener = _change_listener()
+    if listener is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "listening": listener.listening,
+        "events": listener.events,
+        "last_event": listener.last_event,
+        "error": listener.error,
+    }
+
+
+class _StockCompactor:
+    # Periodically posts open stock movements into items.qty_on_hand (one
+    # items update per moved item instead of one per sale) and drops posted
+    # movements past the retention. Only one app process compacts at a time;
+    # the others skip their turn.
+    def __init__(self, interval: float, retain_days: int) -> None:
+        self._interval = interval
+        self._retain_days = retain_days
+        self.last_run: datetime | None = None
+        self.last_posted = 0
+        self.error: str | None = None
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="bootcampx-stock-compact", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.compact()
+                self.error = None
+            except Exception as exc:
+                self.error = error_message(exc)
+
+    def compact(self, max_rows: int | None = 100_000) -> int:
+        with transaction() as conn:
+            if not conn.execute("select pg_try_advisory_xact_lock(hashtext('bootcampx.stock_compact'))").fetchone()[0]:
+                return 0
+            posted = conn.execute("select stock_ledger_compact(%s)", (max_rows,)).fetchone()[0]
+            conn.execute(
+                "delete from stock_movements where posted and moved_at < now() - make_interval(days => %s)",
+                (self._retain_days,),
+            )
+        self.last_run = datetime.now()
+        self.last_posted = posted
+        return posted
+
+
+@st.cache_resource
+def stock_compactor() -> _StockCompactor:
+    compactor = _StockCompactor(
+        float(_setting("STOCK_COMPACT_SECONDS", "60")), int(_setting("STOCK_LEDGER_RETAIN_DAYS", "30"))
+    )
+    compactor.start()
+    return compactor
+
+
+def stock_ledger_status() -> dict[str, Any]:
+    if not _STOCK_LEDGER:
+        return {"enabled": False}
+    compactor = stock_compactor()
+    open_movements = execute(
+        "select count(*) as movements, min(moved_at) as oldest from stock_movements where not posted",
+        fetchone=True,
+    )
+    return {
+        "enabled": True,
+        "open_movements": open_movements["movements"],
+        "oldest_open": open_movements["oldest"],
+        "last_compaction": compactor.last_run,
+        "last_posted": compactor.last_posted,
+        "error": compactor.error,
+    }
+
+
+def _minute_of_day(hhmm: str) -> int:
+    hours, _, minutes = hhmm.strip().partition(":")
+    return int(hours) * 60 + int(minutes or 0)
+
+
+class _KeepWarm:
+    # During business hours keeps at least min_size pool connections open,
+    # validates them and pings the database every interval, so a serverless
+    # compute that suspends when idle (Neon) is awake and the pool holds live,
+    # pre-prepared connections when a cashier checks out. Outside the hours
+    # the pool's minimum goes back to DB_POOL_MIN_SIZE and the database is
+    # left to suspend. hours is (start, end) in minutes of the day, local
+    # time; end before start spans midnight, None means always.
+    def __init__(self, interval: float, min_size: int, hours: tuple[int, int] | None) -> None:
+        self._interval = interval
+        self._min_size = min_size
+        self._hours = hours
+        self.active = False
+        self.last_ping: datetime | None = None
+        self.last_ping_ms: float | None = None
+        self.error: str | None = None
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="bootcampx-keep-warm", daemon=True).start()
+
+    def _run(self) -> None:
+        pool = _pool()
+        base_min = pool.min_size
+        while True:
+            try:
+                if self.in_hours(datetime.now()):
+                    self.active = True
+                    if pool.min_size < self._min_size:
+                        pool.resize(min(self._min_size, pool.max_size), pool.max_size)
+                    # Check out the idle connections together: the pool
+                    # validates each on checkout and replaces the dead ones.
+                    # (pool.check() would empty the pool and grow it each time.)
+                    idle = max(1, min(self._min_size, pool.get_stats().get("pool_available", 0)))
+                    started = time.perf_counter()
+                    with ExitStack() as stack:
+                        conns = [stack.enter_context(pool.connection()) for _ in range(idle)]
+                        conns[0].execute("select 1")
+                    self.last_ping_ms = (time.perf_counter() - started) * 1000
+                    self.last_ping = datetime.now()
+                else:
+                    self.active = False
+                    if pool.min_size != base_min:
+                        pool.resize(base_min, pool.max_size)  # extra connections close after DB_POOL_MAX_IDLE
+                self.error = None
+            except Exception as exc:
+                self.error = error_message(exc)
+            time.sleep(self._interval)
+
+    def in_hours(self, now: datetime) -> bool:
+        if self._hours is None:
+            return True
+        start, end = self._hours
+        minute = now.hour * 60 + now.minute
+        if start <= end:
+            return start <= minute < end
+        return minute >= start or minute < end
+
+
+@st.cache_resource
+def keep_warm() -> _KeepWarm | None:
+    if not _flag("KEEP_WARM"):
+        return None
+    hours = _setting("KEEP_WARM_HOURS")
+    start, _, end = hours.partition("-")
+    warm = _KeepWarm(
+        float(_setting("KEEP_WARM_SECONDS", "60")),
+        int(_setting("KEEP_WARM_MIN_SIZE", "2")),
+        (_minute_of_day(start), _minute_of_day(end)) if hours else None,
+    )
+    warm.start()
+    return warm
+
+
+def keep_warm_status() -> dict[str, Any]:
+    warm = keep_warm()
+    if warm is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "active": warm.active,
+        "last_ping": warm.last_ping,
+        "last_ping_ms": warm.last_ping_ms,
+        "error": warm.error,
+    }
+
+
+def _like(term: str) -> str:
+    escaped = term.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+@st.cache_resource
+def _has_trgm() -> bool:
+    return execute("select exists (select 1 from pg_extension where extname = 'pg_trgm') as ok", fetchone=True)["ok"]
+
+
+def search_limit() -> int:
+    return int(_setting("SEARCH_LIMIT", "200"))
+
+
+def search_items(term: str, *, active_only: bool = True, limit: int | None = None) -> pd.DataFrame:
+    term = term.strip()
+    where = ["active is true"] if active_only else []
+    params: list[Any] = []
+    order_sql = "item_name"
+    if term:
+        where.append("(item_name ilike %s or sku ilike %s or barcode ilike %s)")
+        like = _like(term)
+        params.extend([like, like, like])
+        # Exact code matches first, then the closest names.
+        rank_sql = "coalesce(sku = %s or barcode = %s, false) desc"
+        params.extend([term, term])
+        if _has_trgm():
+            rank_sql += ", greatest(word_similarity(%s, item_name), similarity(sku, %s), similarity(barcode, %s)) desc"
+            params.extend([term, term, term])
+        order_sql = f"{rank_sql}, item_name"
+    params.append(limit if limit is not None else search_limit())
+
+    where_sql = "where " + " and ".join(where) if where else ""
     return query_df(
-        """
+        f"""
         select item_id, item_name, sku, barcode, qty_on_hand, unit, sell_price, active, created_at
-        from items
-        order by item_name
-        """
+        from {_ITEMS}
+        {where_sql}
+        order by {order_sql}
+        limit %s
+        """,
+        tuple(params),
+    )
+
+
+def search_cashiers(term: str, *, limit: int | None = None) -> pd.DataFrame:
+    term = term.strip()
+    where_sql = ""
+    params: list[Any] = []
+    order_sql = "full_name"
+    if term:
+        where_sql = "where full_name ilike %s or username ilike %s"
+        like = _like(term)
+        params.extend([like, like])
+        rank_sql = "coalesce(username = %s, false) desc"
+        params.append(term)
+        if _has_trgm():
+            rank_sql += ", greatest(word_similarity(%s, full_name), similarity(username, %s)) desc"
+            params.extend([term, term])
+        order_sql = f"{rank_sql}, full_name"
+    params.append(limit if limit is not None else search_limit())
+
+    return query_df(
+        f"""
+        select cashier_id, full_name, username, active, created_at
+        from cashiers
+        {where_sql}
+        order by {order_sql}
+        limit %s
+        """,
+        tuple(params),
+    )
+
+
+@dataclass(frozen=True)
+class SalesFilter:
+    start: datetime
+    end: datetime
+    cashier_id: int | None = None
+    item_search: str = ""
+
+    def where(self) -> tuple[str, list[Any]]:
+        return self._where("s", ["s.sold_at >= %s", "s.sold_at < %s"], [self.start, self.end])
+
+    def where_daily(self) -> tuple[str, list[Any]]:
+        # The same filter over a daily rollup (alias d); only exact when start
+        # and end fall on midnight. Item searches need sales_daily.
+        return self._where("d", ["d.day >= %s", "d.day < %s"], [self.start.date(), self.end.date()])
+
+    def _where(self, alias: str, conditions: list[str], params: list[Any]) -> tuple[str, list[Any]]:
+        if self.cashier_id is not None:
+            conditions.append(f"{alias}.cashier_id = %s")
+            params.append(self.cashier_id)
+        if self.item_search.strip():
+            # Resolved against items first so the trigram indexes pick the items,
+            # then sales is probed by (item_id, sold_at).
+            conditions.append(
+                f"{alias}.item_id in (select item_id from items where item_name ilike %s or sku ilike %s or barcode ilike %s)"
+            )
+            like = _like(self.item_search)
+            params.extend([like, like, like])
+        return " and ".join(conditions), params
+
+
+_SALES_SCHEMA = {
+    "sale_id": "int64",
+    "sold_at": "timestamp",
+    "cashier": "string",
+    "item_name": "string",
+    "sku": "string",
+    "barcode": "string",
+    "qty": "decimal",
+    "unit": "string",
+    "unit_price": "decimal",
+    "line_total": "decimal",
+}
+
+_SALES_COLUMNS = """
+  s.sale_id,
+  s.sold_at,
+  c.full_name as cashier,
+  i.item_name,
+  i.sku,
+  i.barcode,
+  s.qty,
+  i.unit,
+  s.unit_price,
+  s.line_total
+"""
+
+
+def _sales_totals_query(filters: SalesFilter) -> Query:
+    where_sql, params = filters.where()
+    return Query(
+        f"""
+        select count(*) as rows, coalesce(sum(s.qty), 0) as qty, coalesce(sum(s.line_total), 0) as revenue
+        from sales s
+        where {where_sql}
+        """,
+        tuple(params),
+    )
+
+
+def _sales_page_query(filters: SalesFilter, after: tuple[datetime, int] | None, limit: int) -> Query:
+    # Keyset pagination on (sold_at, sale_id), newest first. Pass the last row's
+    # (sold_at, sale_id) as `after` to get the next page.
+    where_sql, params = filters.where()
+    if after is not None:
+        where_sql += " and (s.sold_at, s.sale_id) < (%s, %s)"
+        params.extend(after)
+    params.append(limit)
+    return Query(
+        f"""
+        select {_SALES_COLUMNS}
+        from sales s
+        join cashiers c on c.cashier_id = s.cashier_id
+        join items i on i.item_id = s.item_id
+        where {where_sql}
+        order by s.sold_at desc, s.sale_id desc
+        limit %s
+        """,
+        tuple(params),
+        _SALES_SCHEMA,
+    )
+
+
+def sales_totals(filters: SalesFilter) -> dict[str, Any]:
+    query = _sales_totals_query(filters)
+    return execute(query.sql, query.params, fetchone=True)
+
+
+def sales_page(
+    filters: SalesFilter,
+    *,
+    after: tuple[datetime, int] | None = None,
+    limit: int = 100,
+) -> pd.DataFrame:
+    query = _sales_page_query(filters, after, limit)
+    return query_df(query.sql, query.params, schema=query.schema)
+
+
+def sales_totals_and_page(
+    filters: SalesFilter,
+    *,
+    after: tuple[datetime, int] | None = None,
+    limit: int = 100,
+) -> tuple[dict[str, Any], pd.DataFrame]:
+    # sales_totals and sales_page, run concurrently.
+    totals, page = query_dfs([_sales_totals_query(filters), _sales_page_query(filters, after, limit)])
+    return totals.astype(object).to_dict("records")[0], page
+
+
+def _sales_export_sql(filters: SalesFilter) -> tuple[str, list[Any]]:
+    where_sql, params = filters.where()
+    return (
+        f"""
+        select {_SALES_COLUMNS}
+        from sales s
+        join cashiers c on c.cashier_id = s.cashier_id
+        join items i on i.item_id = s.item_id
+        where {where_sql}
+        order by s.sold_at desc, s.sale_id desc
+        """,
+        params,
     )
+
+
+def _spool() -> tempfile.SpooledTemporaryFile:
+    # Small exports stay in memory; anything larger spills to a temp file
+    # while it is written. The download itself is served from memory by
+    # Streamlit, so exports are also capped (_check_export_size).
+    return tempfile.SpooledTemporaryFile(max_size=int(_setting("EXPORT_SPOOL_BYTES", str(16 * 1024 * 1024))))
+
+
+def _check_export_size(spool: tempfile.SpooledTemporaryFile) -> None:
+    limit = int(_setting("EXPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+    if spool.tell() > limit:
+        raise ValueError(
+            f"The export is larger than {limit / 1024 / 1024:.0f} MiB (EXPORT_MAX_BYTES). Narrow the dates or filters."
+        )
+
+
+def export_sales_csv(filters: SalesFilter) -> tempfile.SpooledTemporaryFile:
+    # Raises ValueError as soon as the file outgrows EXPORT_MAX_BYTES.
+    sql, params = _sales_export_sql(filters)
+    spool = _spool()
+    try:
+        with transaction() as conn:
+            with conn.cursor() as cur:
+                with cur.copy(f"copy ({sql}) to stdout with (format csv, header)", params) as copy:
+                    for chunk in copy:
+                        spool.write(chunk)
+                        _check_export_size(spool)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def export_sales_parquet(filters: SalesFilter) -> tempfile.SpooledTemporaryFile:
+    # Raises ValueError as soon as the file outgrows EXPORT_MAX_BYTES.
+    sql, params = _sales_export_sql(filters)
+    batch_rows = int(_setting("EXPORT_BATCH_ROWS", "50000"))
+    spool = _spool()
+    try:
+        _write_sales_parquet(spool, sql, params, batch_rows)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def _write_sales_parquet(
+    spool: tempfile.SpooledTemporaryFile, sql: str, params: list[Any], batch_rows: int
+) -> None:
+    with transaction() as conn:
+        with conn.cursor(name="sales_export") as cur:
+            cur.execute(sql, params)
+            # Every batch must share one schema, so nothing is left to inference.
+            arrow_schema = pa.schema(
+                [
+                    (
+                        column.name,
+                        _arrow_type(column, _session_timezone(conn))
+                        or (pa.decimal128(38, 10) if column.type_code == _NUMERIC_OID else pa.string()),
+                    )
+                    for column in cur.description
+                ]
+            )
+            with pq.ParquetWriter(spool, arrow_schema) as writer:
+                while rows := cur.fetchmany(batch_rows):
+                    columns = list(zip(*rows))
+                    writer.write_batch(
+                        pa.record_batch(
+                            [pa.array(values, type=field.type) for values, field in zip(columns, arrow_schema)],
+                            schema=arrow_schema,
+                        )
+                    )
+                    _check_export_size(spool)
+
+
+# Columns an item import may carry; only item_name is needed for new items.
+_IMPORT_COLUMNS = ["item_name", "sku", "barcode", "unit", "qty_on_hand", "sell_price", "active"]
+
+_IMPORT_NUMERIC = r"^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)$"
+
+# Rows are numbered as in a spreadsheet: the header is row 1.
+_SQL_IMPORT_STAGING = """
+create temp table item_import (
+  row_no bigint generated always as identity (start with 2),
+  item_name text, sku text, barcode text, unit text, qty_on_hand text, sell_price text, active text
+) on commit drop
+"""
+
+_SQL_IMPORT_ERRORS = f"""
+with s as (
+  select
+    row_no,
+    nullif(btrim(item_name), '') as item_name,
+    nullif(btrim(sku), '') as sku,
+    nullif(btrim(barcode), '') as barcode,
+    nullif(btrim(qty_on_hand), '') as qty_on_hand,
+    nullif(btrim(sell_price), '') as sell_price,
+    lower(nullif(btrim(active), '')) as active
+  from item_import
+), checked as (
+  select
+    s.row_no,
+    array[
+      case when s.item_name is null and i.item_id is null then 'item_name is required for new items' end,
+      case when s.qty_on_hand !~ '{_IMPORT_NUMERIC}' then 'qty_on_hand is not a number'
+           when abs(s.qty_on_hand::numeric) >= 1e11 then 'qty_on_hand is out of range' end,
+      case when s.sell_price !~ '{_IMPORT_NUMERIC}' then 'sell_price is not a number'
+           when s.sell_price::numeric < 0 or s.sell_price::numeric >= 1e10 then 'sell_price is out of range' end,
+      case when s.active not in ('true', 'false', 't', 'f', 'yes', 'no', 'y', 'n', '1', '0') then 'active must be true or false' end,
+      case when s.sku is not null and count(*) over (partition by s.sku) > 1 then 'sku appears more than once in the file' end,
+      case when s.barcode is not null and count(*) over (partition by s.barcode) > 1 then 'barcode appears more than once in the file' end,
+      case when b.item_id is not null and b.item_id is distinct from i.item_id
+           then 'barcode already belongs to item ' || b.item_id || ' (' || b.item_name || ')' end
+    ] as errors
+  from s
+  left join items i on i.sku = s.sku
+  left join items b on b.barcode = s.barcode
+)
+select row_no as row, error
+from checked, unnest(errors) as error
+where error is not null
+order by row_no
+"""
+
+_SQL_IMPORT_TYPED = """
+create temp table item_import_typed on commit drop as
+select
+  row_no,
+  nullif(btrim(item_name), '') as item_name,
+  nullif(btrim(sku), '') as sku,
+  nullif(btrim(barcode), '') as barcode,
+  nullif(btrim(unit), '') as unit,
+  round(nullif(btrim(qty_on_hand), '')::numeric, 3) as qty_on_hand,
+  round(nullif(btrim(sell_price), '')::numeric, 2) as sell_price,
+  lower(nullif(btrim(active), ''))::boolean as active
+from item_import
+"""
+
+# Empty cells keep the current value on update and take the column default on insert.
+_SQL_IMPORT_UPDATE = f"""
+update {_ITEMS} i
+set item_name = coalesce(s.item_name, i.item_name),
+    barcode = coalesce(s.barcode, i.barcode),
+    unit = coalesce(s.unit, i.unit),
+    qty_on_hand = coalesce(s.qty_on_hand, i.qty_on_hand),
+    sell_price = coalesce(s.sell_price, i.sell_price),
+    active = coalesce(s.active, i.active)
+from item_import_typed s
+where i.sku = s.sku
+  and (
+    coalesce(s.item_name, i.item_name), coalesce(s.barcode, i.barcode), coalesce(s.unit, i.unit),
+    coalesce(s.qty_on_hand, i.qty_on_hand), coalesce(s.sell_price, i.sell_price), coalesce(s.active, i.active)
+  ) is distinct from (i.item_name, i.barcode, i.unit, i.qty_on_hand, i.sell_price, i.active)
+"""
+
+_SQL_IMPORT_INSERT = """
+insert into items (item_name, sku, barcode, unit, qty_on_hand, sell_price, active)
+select s.item_name, s.sku, s.barcode, coalesce(s.unit, 'pcs'), coalesce(s.qty_on_hand, 0), coalesce(s.sell_price, 0), coalesce(s.active, true)
+from item_import_typed s
+where s.sku is null or not exists (select 1 from items i where i.sku = s.sku)
+order by s.row_no
+"""
+
+
+@dataclass(frozen=True)
+class ItemImport:
+    rows: int
+    inserted: int
+    updated: int
+    errors: pd.DataFrame  # row, error; nothing is written when it is non-empty
+
+
+def import_items(file: Any, filename: str) -> ItemImport:
+    # CSV bytes are streamed into a temp staging table with COPY, validated in
+    # one query, then upserted on sku: existing SKUs are updated, everything
+    # else inserted, all in one transaction and only if no row has an error.
+    # XLSX files are converted to CSV first (needs openpyxl).
+    if filename.lower().endswith(".xlsx"):
+        sheet = pd.read_excel(file, dtype=str, keep_default_na=False)
+        file = tempfile.SpooledTemporaryFile(max_size=int(_setting("EXPORT_SPOOL_BYTES", str(16 * 1024 * 1024))))
+        file.write(sheet.to_csv(index=False).encode())
+        file.seek(0)
+
+    header = file.readline().decode("utf-8-sig")
+    columns = [name.strip().lower() for name in next(csv.reader([header]), [])]
+    unknown = [name for name in columns if name not in _IMPORT_COLUMNS]
+    if not columns or unknown or len(set(columns)) != len(columns):
+        problem = f"unknown columns: {', '.join(unknown)}" if unknown else "missing or repeated column names"
+        raise ValueError(f"Header row has {problem}. Expected some of: {', '.join(_IMPORT_COLUMNS)}.")
+
+    with transaction() as conn:
+        with conn.cursor() as cur:
+            cur.execute(_SQL_IMPORT_STAGING)
+            column_list = psycopg.sql.SQL(", ").join(map(psycopg.sql.Identifier, columns))
+            copy_sql = psycopg.sql.SQL("copy item_import ({}) from stdin with (format csv, encoding 'UTF8')").format(
+                column_list
+            )
+            with cur.copy(copy_sql) as copy:
+                while chunk := file.read(1024 * 1024):
+                    copy.write(chunk)
+            rows = cur.rowcount
+
+            cur.execute(_SQL_IMPORT_ERRORS)
+            errors = pd.DataFrame(cur.fetchall(), columns=["row", "error"])
+            if not errors.empty:
+                conn.rollback()
+                return ItemImport(rows=rows, inserted=0, updated=0, errors=errors)
+
+            cur.execute(_SQL_IMPORT_TYPED)
+            cur.execute("analyze item_import_typed")
+            cur.execute(_SQL_IMPORT_UPDATE)
+            updated = cur.rowcount
+            cur.execute(_SQL_IMPORT_INSERT)
+            inserted = cur.rowcount
+    return ItemImport(rows=rows, inserted=inserted, updated=updated, errors=errors)
@@ -1,46 +1,63 @@
 from __future__ import annotations
 
+from datetime import datetime
 from decimal import Decimal, InvalidOperation
 
-import psycopg
 import streamlit as st
-from psycopg.rows import dict_row
 
+import bootstrap
 import db
-import ui
+import sale_queue
 
 
-st.set_page_config(page_title="Sell (POS)", layout="wide")
-ui.render_branding()
-st.title("Sell (POS)")
+bootstrap.page("Sell (POS)")
 
-if not db.is_configured():
-    st.warning("`DATABASE_URL` is not set.")
-    st.stop()
-
-cashiers = db.active_cashiers_df()
-items = db.active_items_for_pos_df()
+cashiers = db.active_cashiers()
+catalog = db.pos_catalog()
 
-if cashiers.empty:
+if cashiers.df.empty:
     st.info("No active cashiers found. Add one in the Cashiers page.")
     st.stop()
 
-if items.empty:
+if catalog.df.empty:
     st.info("No active items found. Add items in the Items page.")
     st.stop()
 
-cashier_ids = cashiers["cashier_id"].tolist()
-
-
-def _cashier_label(cid: int) -> str:
-    row = cashiers.loc[cashiers["cashier_id"] == cid].iloc[0]
-    username = row["username"]
-    suffix = f" (@{username})" if username else ""
-    return f"{row['full_name']}{suffix}"
-
+if sale_queue.enabled():
+    queue = sale_queue.get()
+    pending = queue.pending_count()
+    if queue.last_error:
+        st.warning(f"{pending} sale(s) waiting to sync. Database unavailable: {queue.last_error}")
+    elif pending:
+        st.caption(f"{pending} sale(s) waiting to sync.")
+    for rejected in queue.rejected():
+        with st.container(border=True):
+            st.error(
+                f"Queued sale from {rejected['queued_at'][:19]} was rejected"
+                + (f" on line {rejected['rejected_line']}" if rejected["rejected_line"] else "")
+                + f": {rejected['message']}"
+            )
+            st.write(
+                [
+                    {
+                        "item": catalog.labels.get(item_id, f"#{item_id}"),
+                        "qty": qty,
+                        "unit_price": unit_price,
+                        "cashier": cashiers.labels.get(rejected["cashier_id"], f"#{rejected['cashier_id']}"),
+                    }
+                    for item_id, qty, unit_price in rejected["lines"]
+                ]
+            )
+            if st.button("Dismiss", key=f"dismiss_{rejected['seq']}"):
+                queue.dismiss(rejected["seq"])
+                st.rerun()
 
 st.subheader("Cashier")
-cashier_id = st.selectbox("Select cashier", options=cashier_ids, format_func=_cashier_label)
+cashier_id = st.selectbox(
+    "Select cashier",
+    options=cashiers.df["cashier_id"].tolist(),
+    format_func=cashiers.labels.__getitem__,
+)
 
 st.divider()
 st.subheader("Item lookup")
@@ -50,39 +67,23 @@ left, right = st.columns([1, 1])
 with left:
     lookup = st.text_input("Scan/enter barcode or SKU", placeholder="e.g. 0123456789 or SKU123")
     if st.button("Find item", use_container_width=True) and lookup.strip():
-        found = db.query_df(
-            """
-            select item_id
-            from items
-            where active is true and (barcode = %s or sku = %s)
-            limit 1
-            """,
-            (lookup.strip(), lookup.strip()),
-        )
-        if found.empty:
+        found_id = db.find_pos_item(lookup)
+        if found_id is None:
             st.warning("No active item matched that barcode/SKU.")
         else:
-            st.session_state["selected_item_id"] = int(found.loc[0, "item_id"])
+            if found_id not in catalog.rows:
+                catalog = db.pos_catalog()
+            st.session_state["selected_item_id"] = found_id
 
 with right:
-    item_ids = items["item_id"].tolist()
-
-    def _item_label(iid: int) -> str:
-        row = items.loc[items["item_id"] == iid].iloc[0]
-        sku = row["sku"] or ""
-        barcode = row["barcode"] or ""
-        extras = " • ".join([x for x in [sku, barcode] if x])
-        suffix = f" ({extras})" if extras else ""
-        return f"{row['item_name']}{suffix}"
-
     selected_item_id = st.selectbox(
         "Search/select item",
-        options=item_ids,
+        options=catalog.df["item_id"].tolist(),
         key="selected_item_id",
-        format_func=_item_label,
+        format_func=catalog.labels.__getitem__,
     )
 
-selected_row = items.loc[items["item_id"] == selected_item_id].iloc[0]
+selected_row = catalog.rows[selected_item_id]
 
 qty_on_hand = selected_row["qty_on_hand"]
 unit = selected_row["unit"]
@@ -94,13 +95,17 @@ c2.metric("Unit", f"{unit}")
 c3.metric("Sell price", f"{sell_price}")
 
 st.divider()
-st.subheader("Sell")
+st.subheader("Cart")
+
+cart = st.session_state.setdefault("cart", [])
 
 qty_input = st.number_input("Quantity", min_value=0.001, value=1.0, step=1.0, format="%.3f")
 
-sell_clicked = st.button("Sell", type="primary", use_container_width=True)
+add_col, clear_col = st.columns([3, 1])
+add_clicked = add_col.button("Add to cart", use_container_width=True)
+clear_clicked = clear_col.button("Clear cart", use_container_width=True)
 
-if sell_clicked:
+if add_clicked:
     try:
         qty = Decimal(str(qty_input))
         if qty <= 0:
@@ -109,53 +114,22 @@ if sell_clicked:
         st.error(f"Invalid quantity: {exc}")
         st.stop()
 
-    try:
-        with db.transaction() as conn:
-            with conn.cursor(row_factory=dict_row) as cur:
-                cur.execute(
-                    """
-                    select sell_price
-                    from items
-                    where item_id = %s and active is true
-                    """,
-                    (int(selected_item_id),),
-                )
-                item_price_row = cur.fetchone()
-                if not item_price_row:
-                    raise RuntimeError("Selected item is not active or no longer exists.")
-                unit_price = item_price_row["sell_price"]
-
-                cur.execute(
-                    """
-                    insert into sales (cashier_id, item_id, qty, unit_price)
-                    values (%s, %s, %s, %s)
-                    returning sale_id, sold_at, cashier_id, item_id, qty, unit_price, line_total
-                    """,
-                    (cashier_id, int(selected_item_id), qty, unit_price),
-                )
-                sale = cur.fetchone()
-                cur.execute(
-                    """
-                    select
-                      s.sale_id, s.sold_at,
-                      c.full_name as cashier,
-                      i.item_name, i.unit,
-                      s.qty, s.unit_price, s.line_total
-                    from sales s
-                    join cashiers c on c.cashier_id = s.cashier_id
-                    join items i on i.item_id = s.item_id
-                    where s.sale_id = %s
-                    """,
-                    (sale["sale_id"],),
-                )
-                receipt = cur.fetchone()
-
-        db.active_items_for_pos_df.clear()
-        db.items_index_df.clear()
-
-        st.success("Sale recorded.")
-        st.subheader("Receipt")
-        st.write(
+    for line in cart:
+        if line["item_id"] == int(selected_item_id):
+            line["qty"] += qty
+            break
+    else:
+        cart.append({"item_id": int(selected_item_id), "qty": qty})
+
+if clear_clicked:
+    cart.clear()
+
+receipts = st.session_state.pop("receipts", None)
+if receipts:
+    st.success(f"Sale recorded ({len(receipts)} line(s)).")
+    st.subheader("Receipt")
+    st.write(
+        [
             {
                 "sold_at": str(receipt["sold_at"]),
                 "cashier": receipt["cashier"],
@@ -165,10 +139,76 @@ if sell_clicked:
                 "line_total": str(receipt["line_total"]),
                 "sale_id": receipt["sale_id"],
             }
-        )
-    except psycopg.errors.RaiseException as exc:
-        msg = getattr(getattr(exc, "diag", None), "message_primary", None) or str(exc)
-        st.error(f"Sale rejected: {msg}")
+            for receipt in receipts
+        ]
+    )
+    st.metric("Total", str(sum(receipt["line_total"] for receipt in receipts)))
+
+if not cart:
+    st.info("Cart is empty. Select an item and add it to the cart.")
+    st.stop()
+
+cart_rows = []
+for n, line in enumerate(cart, start=1):
+    line_item = catalog.rows.get(line["item_id"])
+    cart_rows.append(
+        {
+            "line": n,
+            "item": catalog.labels[line["item_id"]] if line_item else f"#{line['item_id']}",
+            "qty": str(line["qty"]),
+            "unit": line_item["unit"] if line_item else "",
+            "unit_price": str(line_item["sell_price"]) if line_item else "",
+            "line_total": str(line["qty"] * line_item["sell_price"]) if line_item else "",
+        }
+    )
+st.dataframe(cart_rows, use_container_width=True, hide_index=True)
+
+remove_col, remove_btn_col = st.columns([3, 1])
+remove_line = remove_col.selectbox("Line", options=list(range(1, len(cart) + 1)), label_visibility="collapsed")
+if remove_btn_col.button("Remove line", use_container_width=True):
+    cart.pop(remove_line - 1)
+    st.rerun()
+
+checkout_clicked = st.button("Checkout", type="primary", use_container_width=True)
+
+if checkout_clicked:
+    try:
+        if sale_queue.enabled():
+            # Confirmed from the local queue; prices are the ones shown above.
+            for n, line in enumerate(cart, start=1):
+                if line["item_id"] not in catalog.rows:
+                    raise db.SaleRejected("Item is not active or no longer exists.", line=n)
+            client_ref = sale_queue.get().enqueue(
+                cashier_id, [(line["item_id"], line["qty"], catalog.rows[line["item_id"]]["sell_price"]) for line in cart]
+            )
+            receipts = [
+                {
+                    "sold_at": f"{datetime.now():%Y-%m-%d %H:%M:%S} (queued)",
+                    "cashier": cashiers.labels[cashier_id],
+                    "item_name": catalog.rows[line["item_id"]]["item_name"],
+                    "unit": catalog.rows[line["item_id"]]["unit"],
+                    "qty": line["qty"],
+                    "unit_price": catalog.rows[line["item_id"]]["sell_price"],
+                    "line_total": line["qty"] * catalog.rows[line["item_id"]]["sell_price"],
+                    "sale_id": client_ref,
+                }
+                for line in cart
+            ]
+        elif db.fast_sale_enabled() and len(cart) == 1:
+            receipts = [db.fast_sale(cashier_id, cart[0]["item_id"], cart[0]["qty"])]
+            db.apply_sale_stock(receipts)
+        else:
+            receipts = db.record_sales(cashier_id, [(line["item_id"], line["qty"]) for line in cart])
+            db.apply_sale_stock(receipts)
+
+        cart.clear()
+        st.session_state["receipts"] = receipts
+        st.rerun()
+    except db.SaleRejected as exc:
+        if exc.line is not None:
+            st.error(f"Sale rejected on line {exc.line} ({cart_rows[exc.line - 1]['item']}): {exc.message}")
+        else:
+            st.error(f"Sale rejected: {exc.message}")
     except Exception as exc:
         st.error("Failed to record sale.")
         st.exception(exc)
@@ -2,22 +2,17 @@ from __future__ import annotations
 
 from decimal import Decimal, InvalidOperation
 
+import pandas as pd
 import psycopg
 import streamlit as st
 
+import bootstrap
 import db
-import ui
 
 
-st.set_page_config(page_title="Items", layout="wide")
-ui.render_branding()
-st.title("Items (Inventory)")
+bootstrap.page("Items", "Items (Inventory)")
 
-if not db.is_configured():
-    st.warning("`DATABASE_URL` is not set.")
-    st.stop()
-
-tab_browse, tab_add, tab_edit = st.tabs(["Browse", "Add", "Edit"])
+tab_browse, tab_add, tab_import, tab_bulk, tab_edit = st.tabs(["Browse", "Add", "Import", "Bulk edit", "Edit"])
 
 with tab_browse:
     st.subheader("Browse items")
@@ -27,25 +22,9 @@ with tab_browse:
     with col2:
         active_only = st.checkbox("Active only", value=True)
 
-    where = []
-    params: list[object] = []
-    if active_only:
-        where.append("active is true")
-    if search.strip():
-        where.append("(item_name ilike %s or sku ilike %s or barcode ilike %s)")
-        like = f"%{search.strip()}%"
-        params.extend([like, like, like])
-
-    where_sql = "where " + " and ".join(where) if where else ""
-    items_df = db.query_df(
-        f"""
-        select item_id, item_name, sku, barcode, qty_on_hand, unit, sell_price, active, created_at
-        from items
-        {where_sql}
-        order by item_name
-        """,
-        tuple(params) if params else None,
-    )
+    items_df = db.search_items(search, active_only=active_only)
+    if len(items_df) >= db.search_limit():
+        st.caption(f"Showing the best {len(items_df)} matches. Refine the search to narrow them down.")
 
     st.dataframe(items_df, use_container_width=True, hide_index=True)
 
@@ -80,8 +59,7 @@ with tab_add:
                 """,
                 (item_name.strip(), sku, barcode, unit.strip() or "pcs", qty_dec, price_dec, active),
             )
-            db.items_index_df.clear()
-            db.active_items_for_pos_df.clear()
+            db.clear_item_caches()
             st.success("Item created.")
         except psycopg.errors.UniqueViolation as exc:
             constraint = getattr(getattr(exc, "diag", None), "constraint_name", "") or ""
@@ -95,23 +73,124 @@ with tab_add:
             st.error("Failed to create item.")
             st.exception(exc)
 
+with tab_import:
+    st.subheader("Import items")
+    st.caption(
+        "CSV (UTF-8) or XLSX with a header row. Columns: item_name, sku, barcode, unit, qty_on_hand, sell_price, active. "
+        "Rows whose SKU already exists update that item; all other rows create items. "
+        "Empty cells keep the current value (or the default for new items). Nothing is saved if any row has an error."
+    )
+    upload = st.file_uploader("Item file", type=["csv", "xlsx"])
+    if upload is not None and st.button("Import", type="primary"):
+        try:
+            result = db.import_items(upload, upload.name)
+        except ValueError as exc:
+            st.error(str(exc))
+        except Exception as exc:
+            st.error(f"Import failed: {db.error_message(exc)}")
+        else:
+            if not result.errors.empty:
+                st.error(
+                    f"{result.errors['row'].nunique()} of {result.rows} row(s) have errors; nothing was imported. "
+                    "Row numbers count the header as row 1."
+                )
+                st.dataframe(result.errors, use_container_width=True, hide_index=True)
+                st.download_button(
+                    "Download error report",
+                    data=result.errors.to_csv(index=False),
+                    file_name="item_import_errors.csv",
+                    mime="text/csv",
+                )
+            else:
+                db.clear_item_caches()
+                st.success(f"Imported {result.rows} row(s): {result.inserted} created, {result.updated} updated.")
+
+with tab_bulk:
+    st.subheader("Bulk edit")
+    st.caption("Edit any number of cells, then save them all at once.")
+    bulk_idx = db.items_index()
+    bulk_filter = st.text_input("Filter (name, barcode, SKU)", key="bulk_filter").strip()
+
+    grid = bulk_idx.df.set_index("item_id")[["item_name", "sku", "barcode", "unit", "qty_on_hand", "sell_price", "active"]]
+    grid = grid.astype({"qty_on_hand": float, "sell_price": float, "active": bool})
+    if bulk_filter:
+        matches = (
+            grid[["item_name", "sku", "barcode"]]
+            .apply(lambda column: column.str.contains(bulk_filter, case=False, regex=False, na=False))
+            .any(axis=1)
+        )
+        grid = grid[matches]
+
+    edited = st.data_editor(
+        grid,
+        key="bulk_editor",
+        num_rows="fixed",
+        use_container_width=True,
+        column_config={
+            "qty_on_hand": st.column_config.NumberColumn("Qty on hand", format="%.3f", step=0.001),
+            "sell_price": st.column_config.NumberColumn("Sell price", format="%.2f", step=0.01, min_value=0),
+            "active": st.column_config.CheckboxColumn("Active"),
+        },
+    )
+
+    changes = []
+    for column in grid.columns:
+        before, after = grid[column], edited[column]
+        differs = ~((before == after) | (before.isna() & after.isna()))
+        for item_id in grid.index[differs.to_numpy()]:
+            new = after[item_id]
+            if column in ("qty_on_hand", "sell_price"):
+                new = Decimal(str(round(float(new), 3 if column == "qty_on_hand" else 2)))
+            elif column == "active":
+                new = bool(new)
+            else:
+                new = None if pd.isna(new) or not str(new).strip() else str(new).strip()
+            changes.append((int(item_id), column, bulk_idx.rows[int(item_id)][column], new))
+
+    changed_items = len({change[0] for change in changes})
+    st.caption(f"{len(changes)} changed cell(s) in {changed_items} item(s).")
+    if st.button("Save all changes", type="primary", disabled=not changes):
+        if any(column == "item_name" and new is None for _, column, _, new in changes):
+            st.error("Item name is required.")
+            st.stop()
+        try:
+            conflicts = db.update_items(changes)
+            db.clear_item_caches()
+        except psycopg.errors.UniqueViolation as exc:
+            constraint = getattr(getattr(exc, "diag", None), "constraint_name", "") or ""
+            if "sku" in constraint:
+                st.error("SKU already exists; nothing was saved.")
+            elif "barcode" in constraint:
+                st.error("Barcode already exists; nothing was saved.")
+            else:
+                st.error("SKU or barcode must be unique; nothing was saved.")
+        except Exception as exc:
+            st.error("Failed to save changes.")
+            st.exception(exc)
+        else:
+            st.session_state.pop("bulk_editor", None)
+            st.session_state["bulk_result"] = (changed_items - len(conflicts), conflicts)
+            st.rerun()
+
+    bulk_result = st.session_state.pop("bulk_result", None)
+    if bulk_result:
+        saved, conflicts = bulk_result
+        st.success(f"Saved {saved} item(s).")
+        if conflicts:
+            st.warning(
+                f"{len(conflicts)} item(s) were changed by someone else while you edited and were not saved: "
+                + ", ".join(bulk_idx.labels.get(item_id, f"#{item_id}") for item_id in conflicts)
+            )
+
 with tab_edit:
     st.subheader("Edit item")
-    idx = db.items_index_df()
-    if idx.empty:
+    idx = db.items_index()
+    if idx.df.empty:
         st.info("No items found.")
         st.stop()
 
-    def _label(iid: int) -> str:
-        row = idx.loc[idx["item_id"] == iid].iloc[0]
-        sku = row["sku"] or ""
-        barcode = row["barcode"] or ""
-        extras = " • ".join([x for x in [sku, barcode] if x])
-        suffix = f" ({extras})" if extras else ""
-        return f"{row['item_name']}{suffix}"
-
-    item_id = st.selectbox("Select item", options=idx["item_id"].tolist(), format_func=_label)
-    row = idx.loc[idx["item_id"] == item_id].iloc[0]
+    item_id = st.selectbox("Select item", options=idx.df["item_id"].tolist(), format_func=idx.labels.__getitem__)
+    row = idx.rows[item_id]
 
     with st.form("edit_item"):
         item_name = st.text_input("Item name", value=str(row["item_name"] or ""))
@@ -135,31 +214,17 @@ with tab_edit:
             st.stop()
 
         try:
-            db.execute(
-                """
-                update items
-                set item_name = %s,
-                    sku = %s,
-                    barcode = %s,
-                    unit = %s,
-                    qty_on_hand = %s,
-                    sell_price = %s,
-                    active = %s
-                where item_id = %s
-                """,
-                (
-                    item_name.strip(),
-                    sku,
-                    barcode,
-                    unit.strip() or "pcs",
-                    qty_dec,
-                    price_dec,
-                    active,
-                    int(item_id),
-                ),
+            db.update_item(
+                int(item_id),
+                item_name=item_name.strip(),
+                sku=sku,
+                barcode=barcode,
+                unit=unit.strip() or "pcs",
+                qty_on_hand=qty_dec,
+                sell_price=price_dec,
+                active=active,
             )
-            db.items_index_df.clear()
-            db.active_items_for_pos_df.clear()
+            db.clear_item_caches()
             st.success("Item updated.")
         except psycopg.errors.UniqueViolation as exc:
             constraint = getattr(getattr(exc, "diag", None), "constraint_name", "") or ""
@@ -3,39 +3,20 @@ from __future__ import annotations
 import psycopg
 import streamlit as st
 
+import bootstrap
 import db
-import ui
 
 
-st.set_page_config(page_title="Cashiers", layout="wide")
-ui.render_branding()
-st.title("Cashiers")
-
-if not db.is_configured():
-    st.warning("`DATABASE_URL` is not set.")
-    st.stop()
+bootstrap.page("Cashiers")
 
 tab_browse, tab_add, tab_edit = st.tabs(["Browse", "Add", "Edit"])
 
 with tab_browse:
     st.subheader("Browse cashiers")
     search = st.text_input("Search (name or username)", placeholder="e.g. Alex, alex01")
-    where = []
-    params: list[object] = []
-    if search.strip():
-        where.append("(full_name ilike %s or username ilike %s)")
-        like = f"%{search.strip()}%"
-        params.extend([like, like])
-    where_sql = "where " + " and ".join(where) if where else ""
-    cashiers_df = db.query_df(
-        f"""
-        select cashier_id, full_name, username, active, created_at
-        from cashiers
-        {where_sql}
-        order by full_name
-        """,
-        tuple(params) if params else None,
-    )
+    cashiers_df = db.search_cashiers(search)
+    if len(cashiers_df) >= db.search_limit():
+        st.caption(f"Showing the best {len(cashiers_df)} matches. Refine the search to narrow them down.")
     st.dataframe(cashiers_df, use_container_width=True, hide_index=True)
 
 with tab_add:
@@ -58,8 +39,7 @@ with tab_add:
                 """,
                 (full_name.strip(), username, active),
             )
-            db.cashiers_index_df.clear()
-            db.active_cashiers_df.clear()
+            db.clear_cashier_caches()
             st.success("Cashier created.")
         except psycopg.errors.UniqueViolation:
             st.error("Username already exists.")
@@ -69,19 +49,15 @@ with tab_add:
 
 with tab_edit:
     st.subheader("Edit cashier")
-    idx = db.cashiers_index_df()
-    if idx.empty:
+    idx = db.cashiers_index()
+    if idx.df.empty:
         st.info("No cashiers found.")
         st.stop()
 
-    def _label(cid: int) -> str:
-        row = idx.loc[idx["cashier_id"] == cid].iloc[0]
-        username = row["username"]
-        suffix = f" (@{username})" if username else ""
-        return f"{row['full_name']}{suffix}"
-
-    cashier_id = st.selectbox("Select cashier", options=idx["cashier_id"].tolist(), format_func=_label)
-    row = idx.loc[idx["cashier_id"] == cashier_id].iloc[0]
+    cashier_id = st.selectbox(
+        "Select cashier", options=idx.df["cashier_id"].tolist(), format_func=idx.labels.__getitem__
+    )
+    row = idx.rows[cashier_id]
 
     with st.form("edit_cashier"):
         full_name = st.text_input("Full name", value=str(row["full_name"] or ""))
@@ -104,8 +80,7 @@ with tab_edit:
                 """,
                 (full_name.strip(), username, active, int(cashier_id)),
             )
-            db.cashiers_index_df.clear()
-            db.active_cashiers_df.clear()
+            db.clear_cashier_caches()
             st.success("Cashier updated.")
         except psycopg.errors.UniqueViolation:
             st.error("Username already exists.")
@@ -2,20 +2,14 @@ from __future__ import annotations
 
 from datetime import date, datetime, timedelta
 
-import pandas as pd
 import streamlit as st
 
+import analytics
+import bootstrap
 import db
-import ui
 
 
-st.set_page_config(page_title="Sales", layout="wide")
-ui.render_branding()
-st.title("Sales")
-
-if not db.is_configured():
-    st.warning("`DATABASE_URL` is not set.")
-    st.stop()
+bootstrap.page("Sales")
 
 st.subheader("Filters")
 
@@ -26,18 +20,13 @@ col1, col2, col3 = st.columns([1, 1, 2])
 with col1:
     date_range = st.date_input("Date range", (default_start, default_end))
 with col2:
-    cashiers = db.cashiers_index_df()
-    cashier_options = ["All"] + (cashiers["cashier_id"].tolist() if not cashiers.empty else [])
-
-    def _cashier_label(opt):
-        if opt == "All":
-            return "All"
-        row = cashiers.loc[cashiers["cashier_id"] == opt].iloc[0]
-        username = row["username"]
-        suffix = f" (@{username})" if username else ""
-        return f"{row['full_name']}{suffix}"
-
-    cashier_filter = st.selectbox("Cashier", options=cashier_options, format_func=_cashier_label)
+    cashiers = db.cashiers_index()
+    cashier_options = ["All"] + list(cashiers.rows)
+    cashier_filter = st.selectbox(
+        "Cashier",
+        options=cashier_options,
+        format_func=lambda opt: "All" if opt == "All" else cashiers.labels[opt],
+    )
 with col3:
     item_search = st.text_input("Item search (name, barcode, SKU)", placeholder="e.g. milk, 0123456789, SKU123")
 
@@ -49,60 +38,76 @@ else:
 start_dt = datetime.combine(start_date, datetime.min.time())
 end_dt = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
 
-conditions = ["s.sold_at >= %s", "s.sold_at < %s"]
-params: list[object] = [start_dt, end_dt]
-
-if cashier_filter != "All":
-    conditions.append("s.cashier_id = %s")
-    params.append(int(cashier_filter))
-
-if item_search.strip():
-    conditions.append("(i.item_name ilike %s or i.sku ilike %s or i.barcode ilike %s)")
-    like = f"%{item_search.strip()}%"
-    params.extend([like, like, like])
-
-where_sql = " and ".join(conditions)
-
-sales_df = db.query_df(
-    f"""
-    select
-      s.sale_id,
-      s.sold_at,
-      c.full_name as cashier,
-      i.item_name,
-      i.sku,
-      i.barcode,
-      s.qty,
-      i.unit,
-      s.unit_price,
-      s.line_total
-    from sales s
-    join cashiers c on c.cashier_id = s.cashier_id
-    join items i on i.item_id = s.item_id
-    where {where_sql}
-    order by s.sold_at desc, s.sale_id desc
-    """,
-    tuple(params),
+filters = db.SalesFilter(
+    start=start_dt,
+    end=end_dt,
+    cashier_id=None if cashier_filter == "All" else int(cashier_filter),
+    item_search=item_search.strip(),
 )
 
+page_size = st.selectbox("Rows per page", options=[50, 100, 250, 500], index=1)
+
+# One keyset cursor per visited page; reset whenever the filters change.
+if st.session_state.get("sales_filters") != (filters, page_size):
+    st.session_state["sales_filters"] = (filters, page_size)
+    st.session_state["sales_cursors"] = [None]
+cursors = st.session_state["sales_cursors"]
+
+totals, page_df = db.sales_totals_and_page(filters, after=cursors[-1], limit=page_size + 1)
+has_next = len(page_df) > page_size
+page_df = page_df.head(page_size)
+
 st.subheader("Results")
-st.dataframe(sales_df, use_container_width=True, hide_index=True)
 
-if sales_df.empty:
+if totals["rows"] == 0:
     st.info("No sales matched your filters.")
-else:
-    total_revenue = sales_df["line_total"].sum()
-    total_qty = sales_df["qty"].sum()
-    c1, c2, c3 = st.columns(3)
-    c1.metric("Rows", f"{len(sales_df)}")
-    c2.metric("Total qty", f"{total_qty}")
-    c3.metric("Total revenue", f"{total_revenue}")
-
-    csv_bytes = sales_df.to_csv(index=False).encode("utf-8")
-    st.download_button(
-        "Download CSV",
-        data=csv_bytes,
-        file_name=f"sales_{start_date}_to_{end_date}.csv",
-        mime="text/csv",
-        use_container_width=True,
-    )
+    st.stop()
+
+c1, c2, c3 = st.columns(3)
+c1.metric("Rows", f"{totals['rows']}")
+c2.metric("Total qty", f"{totals['qty']}")
+c3.metric("Total revenue", f"{totals['revenue']}")
+
+bucket_col, measure_col = st.columns(2)
+bucket = bucket_col.selectbox("Chart buckets", options=["auto", *analytics.BUCKETS], format_func=str.title)
+measure = measure_col.selectbox("Chart measure", options=["revenue", "qty", "transactions"], format_func=str.title)
+series = analytics.sales_series(filters, None if bucket == "auto" else bucket)
+st.line_chart(series.df.set_index("bucket")[measure])
+if series.stride is not None and series.stride != analytics.BUCKETS[series.bucket]:
+    hours = int(series.stride.total_seconds() // 3600)
+    width = f"{hours // 24}-day" if hours % 24 == 0 else f"{hours}-hour"
+    st.caption(f"{series.bucket.title()} buckets merged into {width} points (at most {analytics.max_points()} per chart).")
+
+st.dataframe(page_df, use_container_width=True, hide_index=True)
+
+prev_col, page_col, next_col = st.columns([1, 2, 1])
+if prev_col.button("Previous", use_container_width=True, disabled=len(cursors) == 1):
+    cursors.pop()
+    st.rerun()
+page_col.caption(f"Page {len(cursors)} of {-(-totals['rows'] // page_size)}")
+if next_col.button("Next", use_container_width=True, disabled=not has_next):
+    last = page_df.iloc[-1]
+    cursors.append((last["sold_at"].to_pydatetime(), int(last["sale_id"])))
+    st.rerun()
+
+export_col, format_col = st.columns([3, 1])
+export_format = format_col.selectbox("Format", options=["CSV", "Parquet"], label_visibility="collapsed")
+if export_col.button("Prepare export", use_container_width=True):
+    try:
+        if export_format == "CSV":
+            export_file, mime = db.export_sales_csv(filters), "text/csv"
+        else:
+            export_file, mime = db.export_sales_parquet(filters), "application/vnd.apache.parquet"
+    except ValueError as exc:
+        st.error(str(exc))
+    else:
+        # Streamlit serves downloads from memory, so the whole file is loaded
+        # here; EXPORT_MAX_BYTES keeps that in check.
+        with export_file:
+            st.download_button(
+                f"Download {export_format}",
+                data=export_file.read(),
+                file_name=f"sales_{start_date}_to_{end_date}.{export_format.lower()}",
+                mime=mime,
+                use_container_width=True,
+            )
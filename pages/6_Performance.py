@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import streamlit as st
+
+import bootstrap
+import db
+
+
+bootstrap.page("Performance")
+
+stats = db.pool_stats()
+checkout = stats["checkout_ms"]
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Connections", f"{stats.get('pool_size', 0)} / {stats.get('pool_max', 0)}")
+c2.metric("Waiting", stats.get("requests_waiting", 0))
+c3.metric("Checkout p95", f"{checkout['p95']:.1f} ms")
+c4.metric("Connection errors", stats.get("connections_errors", 0) + stats.get("requests_errors", 0))
+
+if db.statement_timeout_dropped():
+    st.warning(
+        "`DB_STATEMENT_TIMEOUT` is not applied behind a `-pooler` host. "
+        "Set it on the role instead: `alter role <user> set statement_timeout = '30s'`."
+    )
+
+listener = db.cache_listener_status()
+if not listener["enabled"]:
+    st.caption("Cache invalidation: off (`CACHE_LISTEN=0`); caches expire by TTL only.")
+elif listener["listening"]:
+    last = f", last at {listener['last_event']:%H:%M:%S}" if listener["last_event"] else ""
+    st.caption(f"Cache invalidation: listening, {listener['events']} change notifications{last}.")
+else:
+    st.warning(f"Cache invalidation listener is disconnected: {listener['error'] or 'connecting'}")
+
+warm = bootstrap.prewarm()
+if warm is not None:
+    if not warm.done:
+        st.caption(f"Prewarm: running since {warm.started_at:%H:%M:%S}.")
+    elif warm.error:
+        st.warning(f"Prewarm failed after {warm.seconds:.1f} s: {warm.error}")
+    else:
+        st.caption(f"Prewarm: pool, schema and caches ready {warm.seconds:.1f} s after {warm.started_at:%H:%M:%S}.")
+
+keep_warm = db.keep_warm_status()
+if keep_warm["enabled"]:
+    if keep_warm["error"]:
+        st.warning(f"Keep-warm ping failed: {keep_warm['error']}")
+    elif not keep_warm["active"]:
+        st.caption("Keep-warm: outside `KEEP_WARM_HOURS`, the database may suspend.")
+    elif keep_warm["last_ping"]:
+        st.caption(f"Keep-warm: last ping at {keep_warm['last_ping']:%H:%M:%S} took {keep_warm['last_ping_ms']:.1f} ms.")
+
+ledger = db.stock_ledger_status()
+if ledger["enabled"]:
+    last = f", last compaction at {ledger['last_compaction']:%H:%M:%S} posted {ledger['last_posted']}" if ledger["last_compaction"] else ""
+    st.caption(f"Stock ledger: {ledger['open_movements']} open movements{last}.")
+    if ledger["error"]:
+        st.warning(f"Stock ledger compaction failed: {ledger['error']}")
+
+st.divider()
+st.subheader("Statements")
+st.caption("Every statement run by this app process since it started (or since the last reset), grouped by page.")
+
+queries = db.query_stats()
+if queries.empty:
+    st.info("No statements recorded yet. Query statistics may be turned off with `DB_QUERY_STATS=0`.")
+else:
+    pages = ["All"] + sorted(queries["page"].unique())
+    page = st.selectbox("Page", options=pages)
+    if page != "All":
+        queries = queries[queries["page"] == page]
+    st.dataframe(queries, use_container_width=True, hide_index=True)
+
+if st.button("Reset statistics"):
+    db.reset_query_stats()
+    st.rerun()
+
+st.divider()
+st.subheader("Slow queries")
+
+slow = db.slow_queries()
+if not slow:
+    st.info("No slow queries recorded.")
+for entry in slow:
+    title = f"{entry['at']:%H:%M:%S} · {entry['page']} · {entry['ms']:.0f} ms · {entry['rows']} rows"
+    with st.expander(title):
+        st.code(entry["sql"].strip(), language="sql")
+        if entry["plan"]:
+            st.code(entry["plan"], language="text")
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Sequence
+
+import psycopg
+import streamlit as st
+
+import db
+
+
+# Local, durable queue of confirmed sales. With SALE_QUEUE=1 the Sell page
+# appends the sale here (one fsync'd SQLite commit) and confirms at once; a
+# background worker flushes pending sales to Postgres in order, in batches,
+# retrying with backoff while the database is slow or asleep. Sales the
+# oversell trigger rejects are kept as "rejected" for the Sell page to report.
+# A batch that fails for any other reason than the connection is retried one
+# sale at a time, and a sale that still fails after max_attempts is rejected
+# too, so it cannot hold up the sales queued behind it.
+_SCHEMA = """
+create table if not exists queued_sales (
+  seq integer primary key autoincrement,
+  client_ref text not null unique,
+  cashier_id integer not null,
+  lines text not null,
+  queued_at text not null,
+  status text not null default 'pending',
+  attempts integer not null default 0,
+  last_error text,
+  rejected_line integer,
+  message text,
+  sale_ids text,
+  dismissed integer not null default 0
+);
+create index if not exists queued_sales_status_seq on queued_sales (status, seq);
+"""
+
+
+def enabled() -> bool:
+    return db._flag("SALE_QUEUE")
+
+
+class SaleQueue:
+    def __init__(self, path: str, batch_size: int, retry_max: float, max_attempts: int) -> None:
+        self.path = path
+        self._batch_size = batch_size
+        self._retry_max = retry_max
+        self._max_attempts = max_attempts
+        self._wake = threading.Event()
+        self.last_error: str | None = None
+        self.last_flush: datetime | None = None
+        with closing(self._connect()) as conn:
+            conn.execute("pragma journal_mode = wal")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # synchronous=full: a confirmed sale survives power loss, not just a crash.
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("pragma synchronous = full")
+        return conn
+
+    def enqueue(self, cashier_id: int, lines: Sequence[tuple[int, Any, Any]]) -> str:
+        # lines are (item_id, qty, unit_price) with the price shown to the customer.
+        # Lines for the same item are merged, as in db.record_sales.
+        merged: dict[int, list[Decimal]] = {}
+        for item_id, qty, unit_price in lines:
+            line = merged.setdefault(int(item_id), [Decimal(0), Decimal(str(unit_price))])
+            line[0] += Decimal(str(qty))
+        if not merged:
+            raise ValueError("Cart is empty.")
+        client_ref = str(uuid.uuid4())
+        payload = json.dumps([[item_id, str(qty), str(price)] for item_id, (qty, price) in merged.items()])
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "insert into queued_sales (client_ref, cashier_id, lines, queued_at) values (?, ?, ?, ?)",
+                (client_ref, int(cashier_id), payload, datetime.now(timezone.utc).isoformat()),
+            )
+        self._wake.set()
+        return client_ref
+
+    def pending_count(self) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("select count(*) from queued_sales where status = 'pending'").fetchone()[0]
+
+    def rejected(self) -> list[dict[str, Any]]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                """
+                select seq, client_ref, cashier_id, lines, queued_at, rejected_line, message
+                from queued_sales
+                where status = 'rejected' and dismissed = 0
+                order by seq
+                """
+            ).fetchall()
+        return [{**dict(row), "lines": json.loads(row["lines"])} for row in rows]
+
+    def dismiss(self, seq: int) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("update queued_sales set dismissed = 1 where seq = ?", (seq,))
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="sale-queue-flush", daemon=True).start()
+
+    def _run(self) -> None:
+        delay = 1.0
+        while True:
+            self._wake.wait(timeout=delay if self.last_error else 5.0)
+            self._wake.clear()
+            try:
+                while self.flush():
+                    pass
+                self.last_error = None
+                delay = 1.0
+            except Exception as exc:
+                self.last_error = db.error_message(exc)
+                delay = min(delay * 2, self._retry_max)
+
+    def flush(self) -> int:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "select seq, client_ref, cashier_id, lines, queued_at, attempts, last_error from queued_sales where status = 'pending' order by seq limit ?",
+                (self._batch_size,),
+            ).fetchall()
+            if not rows:
+                return 0
+            if rows[0]["attempts"]:
+                # The head failed before: send it alone, so a failing sale is
+                # found and set aside instead of failing every batch.
+                rows = rows[:1]
+                if rows[0]["attempts"] >= self._max_attempts:
+                    with conn:
+                        conn.execute(
+                            "update queued_sales set status = 'rejected', message = ? where seq = ?",
+                            (f"Could not be recorded: {rows[0]['last_error']}", rows[0]["seq"]),
+                        )
+                    return 1
+            sales = []
+            for row in rows:
+                lines = json.loads(row["lines"])
+                sales.append(
+                    {
+                        "client_ref": row["client_ref"],
+                        "cashier_id": row["cashier_id"],
+                        "sold_at": datetime.fromisoformat(row["queued_at"]),
+                        "item_ids": [line[0] for line in lines],
+                        "qtys": [Decimal(line[1]) for line in lines],
+                        "unit_prices": [Decimal(line[2]) for line in lines],
+                    }
+                )
+
+            try:
+                results = db.record_queued_sales(sales)
+            except Exception as exc:
+                # Connection problems (the database is down, or the pool timed
+                # out) are not the sales' fault and do not count as attempts.
+                attempt = 0 if isinstance(exc, psycopg.OperationalError) else 1
+                with conn:
+                    conn.executemany(
+                        "update queued_sales set attempts = attempts + ?, last_error = ? where seq = ?",
+                        [(attempt, db.error_message(exc), row["seq"]) for row in rows],
+                    )
+                raise
+
+            # If the app dies before this commit, the next flush finds the refs
+            # in queued_sale_refs and only marks them sent.
+            with conn:
+                for row in rows:
+                    result = results[row["client_ref"]]
+                    if isinstance(result, db.SaleRejected):
+                        conn.execute(
+                            "update queued_sales set status = 'rejected', rejected_line = ?, message = ? where seq = ?",
+                            (result.line, result.message, row["seq"]),
+                        )
+                    else:
+                        conn.execute(
+                            "update queued_sales set status = 'sent', sale_ids = ?, last_error = null where seq = ?",
+                            (json.dumps(result), row["seq"]),
+                        )
+                conn.execute(
+                    "delete from queued_sales where status = 'sent' and queued_at < ?",
+                    ((datetime.now(timezone.utc) - timedelta(days=7)).isoformat(),),
+                )
+        self.last_flush = datetime.now()
+        db.clear_item_caches()
+        return len(rows)
+
+
+@st.cache_resource
+def get() -> SaleQueue:
+    queue = SaleQueue(
+        os.path.abspath(db._setting("SALE_QUEUE_PATH", "sale_queue.sqlite3")),
+        int(db._setting("SALE_QUEUE_BATCH", "50")),
+        float(db._setting("SALE_QUEUE_RETRY_MAX_SECONDS", "30")),
+        int(db._setting("SALE_QUEUE_MAX_ATTEMPTS", "5")),
+    )
+    queue.start()
+    return queue
@@ -0,0 +1,780 @@
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import date, datetime
+from typing import Any
+
+import psycopg
+import streamlit as st
+from psycopg import sql
+
+import db
+
+
+_SALES_DAILY = """
+create table sales_daily (
+  day date not null,
+  item_id bigint not null,
+  cashier_id bigint not null,
+  qty numeric not null default 0,
+  revenue numeric not null default 0,
+  transactions bigint not null default 0,
+  primary key (day, item_id, cashier_id)
+);
+"""
+
+# Store-wide series (charts, Dashboard totals) sum this instead of
+# sales_daily: one row per day and cashier rather than per item sold. Keyed
+# by cashier, so concurrent tills never wait on each other's rollup row.
+_SALES_DAILY_CASHIER = """
+create table sales_daily_cashier (
+  day date not null,
+  cashier_id bigint not null,
+  qty numeric not null default 0,
+  revenue numeric not null default 0,
+  transactions bigint not null default 0,
+  primary key (day, cashier_id)
+);
+"""
+
+_SALES_DAILY_APPLY = """
+create or replace function sales_daily_apply() returns trigger
+language plpgsql as $$
+begin
+  if tg_op in ('UPDATE', 'DELETE') then
+    insert into sales_daily as d (day, item_id, cashier_id, qty, revenue, transactions)
+    select sold_at::date, item_id, cashier_id, -sum(qty), -sum(line_total), -count(*)
+    from old_rows
+    group by 1, 2, 3
+    on conflict (day, item_id, cashier_id) do update
+      set qty = d.qty + excluded.qty,
+          revenue = d.revenue + excluded.revenue,
+          transactions = d.transactions + excluded.transactions;
+    insert into sales_daily_cashier as d (day, cashier_id, qty, revenue, transactions)
+    select sold_at::date, cashier_id, -sum(qty), -sum(line_total), -count(*)
+    from old_rows
+    group by 1, 2
+    on conflict (day, cashier_id) do update
+      set qty = d.qty + excluded.qty,
+          revenue = d.revenue + excluded.revenue,
+          transactions = d.transactions + excluded.transactions;
+  end if;
+  if tg_op in ('INSERT', 'UPDATE') then
+    insert into sales_daily as d (day, item_id, cashier_id, qty, revenue, transactions)
+    select sold_at::date, item_id, cashier_id, sum(qty), sum(line_total), count(*)
+    from new_rows
+    group by 1, 2, 3
+    on conflict (day, item_id, cashier_id) do update
+      set qty = d.qty + excluded.qty,
+          revenue = d.revenue + excluded.revenue,
+          transactions = d.transactions + excluded.transactions;
+    insert into sales_daily_cashier as d (day, cashier_id, qty, revenue, transactions)
+    select sold_at::date, cashier_id, sum(qty), sum(line_total), count(*)
+    from new_rows
+    group by 1, 2
+    on conflict (day, cashier_id) do update
+      set qty = d.qty + excluded.qty,
+          revenue = d.revenue + excluded.revenue,
+          transactions = d.transactions + excluded.transactions;
+  end if;
+  return null;
+end
+$$;
+"""
+
+_SALES_DAILY_TRIGGERS = """
+create trigger sales_daily_insert after insert on sales
+  referencing new table as new_rows
+  for each statement execute function sales_daily_apply();
+
+create trigger sales_daily_update after update on sales
+  referencing old table as old_rows new table as new_rows
+  for each statement execute function sales_daily_apply();
+
+create trigger sales_daily_delete after delete on sales
+  referencing old table as old_rows
+  for each statement execute function sales_daily_apply();
+"""
+
+_SALES_DAILY_BACKFILL = """
+insert into sales_daily (day, item_id, cashier_id, qty, revenue, transactions)
+select sold_at::date, item_id, cashier_id, sum(qty), sum(line_total), count(*)
+from sales
+group by 1, 2, 3
+"""
+
+_SALES_DAILY_CASHIER_BACKFILL = """
+insert into sales_daily_cashier (day, cashier_id, qty, revenue, transactions)
+select day, cashier_id, sum(qty), sum(revenue), sum(transactions)
+from sales_daily
+group by 1, 2
+"""
+
+
+# One NOTIFY per changed table per transaction (Postgres folds duplicate
+# notifications until commit), so app replicas can drop only the caches that
+# table feeds. Statements that touch no rows stay silent.
+_CHANGE_NOTIFY = """
+create or replace function bootcampx_notify_change() returns trigger
+language plpgsql as $$
+begin
+  if tg_op = 'DELETE' then
+    perform 1 from old_rows limit 1;
+  else
+    perform 1 from new_rows limit 1;
+  end if;
+  if found then
+    perform pg_notify('bootcampx_changes', tg_table_name);
+  end if;
+  return null;
+end
+$$;
+"""
+
+_CHANGE_NOTIFY_TABLES = ["items", "cashiers", "sales"]
+
+
+# updated_at is stamped per row at write time (clock_timestamp, not the
+# transaction start) so the POS catalog can fetch only rows changed since its
+# last sync. Adding the column with a stable default does not rewrite items.
+_ITEMS_UPDATED_AT = """
+alter table items add column updated_at timestamptz not null default now();
+
+create or replace function items_touch_updated_at() returns trigger
+language plpgsql as $$
+begin
+  new.updated_at := clock_timestamp();
+  return new;
+end
+$$;
+
+create trigger items_touch_updated_at before insert or update on items
+  for each row execute function items_touch_updated_at();
+"""
+
+
+# Refs of sales flushed from the local sale queue (see sale_queue.py), so a
+# flush retried after an unacknowledged commit never records a sale twice.
+_QUEUED_SALE_REFS = """
+create table if not exists queued_sale_refs (
+  client_ref text primary key,
+  sale_ids bigint[] not null default '{}',
+  recorded_at timestamptz not null default now()
+)
+"""
+
+
+# Optional stock model (STOCK_LEDGER=1). Sales and stock edits append rows to
+# stock_movements instead of updating items, so concurrent sales of one item
+# no longer queue on its row lock or leave a dead items tuple each. The
+# on-hand quantity is items.qty_on_hand (the posted balance) plus the
+# movements not yet posted; stock_ledger_compact() folds those into the
+# balance in one transaction, so every reader sees the same total before and
+# after. The oversell check takes a per-item advisory lock instead of the row
+# lock, in key order so baskets that share items cannot deadlock, and holds
+# it until commit.
+_STOCK_LEDGER = """
+create table stock_movements (
+  movement_id bigint generated always as identity primary key,
+  item_id bigint not null references items (item_id),
+  qty_delta numeric(14, 3) not null,
+  reason text not null,
+  sale_id bigint,
+  moved_at timestamptz not null default clock_timestamp(),
+  posted boolean not null default false
+);
+
+create index stock_movements_unposted_idx on stock_movements (item_id) include (qty_delta, moved_at) where not posted;
+create index stock_movements_moved_at_idx on stock_movements using brin (moved_at);
+
+create view items_on_hand as
+select
+  i.item_id, i.item_name, i.sku, i.barcode, i.unit,
+  i.qty_on_hand + coalesce(m.qty_delta, 0) as qty_on_hand,
+  i.sell_price, i.active, i.created_at,
+  greatest(i.updated_at, m.moved_at) as updated_at
+from items i
+left join (
+  select item_id, sum(qty_delta) as qty_delta, max(moved_at) as moved_at
+  from stock_movements
+  where not posted
+  group by item_id
+) m on m.item_id = i.item_id;
+
+create or replace function stock_ledger_sales() returns trigger
+language plpgsql as $$
+declare
+  lock_key integer;
+  short record;
+begin
+  for lock_key in select distinct hashint8(item_id) from new_rows order by 1 loop
+    perform pg_advisory_xact_lock(hashtext('bootcampx.stock'), lock_key);
+  end loop;
+  select n.item_id, i.qty_on_hand + coalesce(m.qty_delta, 0) as on_hand, n.qty
+  into short
+  from (select item_id, sum(qty) as qty from new_rows group by item_id) n
+  join items i on i.item_id = n.item_id
+  left join lateral (
+    select sum(qty_delta) as qty_delta from stock_movements where item_id = n.item_id and not posted
+  ) m on true
+  where i.qty_on_hand + coalesce(m.qty_delta, 0) < n.qty
+  order by n.item_id
+  limit 1;
+  if found then
+    raise exception 'Insufficient stock for item %: on hand %, requested %', short.item_id, short.on_hand, short.qty;
+  end if;
+  insert into stock_movements (item_id, qty_delta, reason, sale_id)
+  select item_id, -qty, 'sale', sale_id from new_rows;
+  return null;
+end
+$$;
+
+-- Triggers on the same event fire in name order. The 00 makes this one run
+-- before sales_daily_insert, so a checkout holds its items' stock locks before
+-- it locks any rollup row; otherwise two checkouts can lock them in opposite
+-- orders and deadlock.
+create trigger sales_00_stock_ledger after insert on sales
+  referencing new table as new_rows
+  for each statement execute function stock_ledger_sales();
+
+-- Writes through items_on_hand: item columns go to items, a new qty_on_hand
+-- becomes an adjustment from the current on-hand (read under the item's lock).
+create or replace function items_on_hand_update() returns trigger
+language plpgsql as $$
+begin
+  if (new.item_name, new.sku, new.barcode, new.unit, new.sell_price, new.active)
+     is distinct from (old.item_name, old.sku, old.barcode, old.unit, old.sell_price, old.active) then
+    update items
+    set item_name = new.item_name, sku = new.sku, barcode = new.barcode, unit = new.unit,
+        sell_price = new.sell_price, active = new.active
+    where item_id = old.item_id;
+  end if;
+  if new.qty_on_hand is distinct from old.qty_on_hand then
+    perform pg_advisory_xact_lock(hashtext('bootcampx.stock'), hashint8(old.item_id));
+    insert into stock_movements (item_id, qty_delta, reason)
+    select old.item_id, new.qty_on_hand - qty_on_hand, 'adjustment'
+    from items_on_hand
+    where item_id = old.item_id and qty_on_hand is distinct from new.qty_on_hand;
+  end if;
+  return new;
+end
+$$;
+
+create trigger items_on_hand_update instead of update on items_on_hand
+  for each row execute function items_on_hand_update();
+
+create or replace function stock_ledger_compact(max_rows integer default null) returns bigint
+language plpgsql as $$
+declare
+  posted_rows bigint;
+begin
+  with batch as (
+    update stock_movements
+    set posted = true
+    where not posted
+      and movement_id in (select movement_id from stock_movements where not posted order by movement_id limit max_rows)
+    returning item_id, qty_delta
+  ), totals as (
+    select item_id, sum(qty_delta) as qty_delta, count(*) as movements
+    from batch
+    group by item_id
+  ), applied as (
+    update items i
+    set qty_on_hand = i.qty_on_hand + t.qty_delta
+    from totals t
+    where i.item_id = t.item_id
+    returning t.movements
+  )
+  select coalesce(sum(movements), 0) into posted_rows from applied;
+  return posted_rows;
+end
+$$;
+"""
+
+
+# (table, index name, definition)
+_INDEXES = [
+    ("items", "items_updated_at_idx", "(updated_at)"),
+    ("sales", "sales_sold_at_sale_id_idx", "(sold_at, sale_id)"),
+    ("sales", "sales_item_id_sold_at_idx", "(item_id, sold_at)"),
+    # Sales are appended in sold_at order, so a BRIN index (a few pages per
+    # million rows) narrows range scans such as the hourly charts to the
+    # block ranges holding the period.
+    ("sales", "sales_sold_at_brin_idx", "using brin (sold_at)"),
+]
+
+# Substring search (ilike '%term%') can only use an index through pg_trgm.
+_TRGM_INDEXES = [
+    ("items", "items_item_name_trgm_idx", "using gin (item_name gin_trgm_ops)"),
+    ("items", "items_sku_trgm_idx", "using gin (sku gin_trgm_ops)"),
+    ("items", "items_barcode_trgm_idx", "using gin (barcode gin_trgm_ops)"),
+    ("cashiers", "cashiers_full_name_trgm_idx", "using gin (full_name gin_trgm_ops)"),
+    ("cashiers", "cashiers_username_trgm_idx", "using gin (username gin_trgm_ops)"),
+]
+
+
+def _exists(conn: psycopg.Connection[Any], relation: str) -> bool:
+    return conn.execute("select to_regclass(%s) is not null", (relation,)).fetchone()[0]
+
+
+def ensure_sales_daily(conn: psycopg.Connection[Any]) -> None:
+    # Table, triggers and backfill are created in one transaction. Creating the
+    # triggers locks out concurrent inserts into sales until commit, so no sale
+    # is counted twice or missed.
+    if not _exists(conn, "sales_daily"):
+        conn.execute(_SALES_DAILY)
+        conn.execute(_SALES_DAILY_CASHIER)
+        conn.execute(_SALES_DAILY_APPLY)
+        conn.execute(_SALES_DAILY_TRIGGERS)
+        conn.execute(_SALES_DAILY_BACKFILL)
+        conn.execute(_SALES_DAILY_CASHIER_BACKFILL)
+    elif not _exists(conn, "sales_daily_cashier"):
+        # Added to an existing rollup: replacing the trigger function does not
+        # lock sales by itself, so inserts are locked out explicitly until the
+        # backfill commits.
+        conn.execute("lock table sales in share row exclusive mode")
+        conn.execute(_SALES_DAILY_CASHIER)
+        conn.execute(_SALES_DAILY_APPLY)
+        conn.execute(_SALES_DAILY_CASHIER_BACKFILL)
+
+
+def ensure_items_updated_at(conn: psycopg.Connection[Any]) -> None:
+    exists = conn.execute(
+        "select exists (select 1 from pg_attribute where attrelid = 'items'::regclass and attname = 'updated_at' and not attisdropped)"
+    ).fetchone()[0]
+    if not exists:
+        conn.execute(_ITEMS_UPDATED_AT)
+
+
+def ensure_change_notify(conn: psycopg.Connection[Any]) -> None:
+    if conn.execute("select to_regprocedure('bootcampx_notify_change()') is not null").fetchone()[0]:
+        return
+    conn.execute(_CHANGE_NOTIFY)
+    for table in _CHANGE_NOTIFY_TABLES:
+        _create_notify_triggers(conn, table)
+
+
+def _create_notify_triggers(conn: psycopg.Connection[Any], table: str) -> None:
+    for op, referencing in (
+        ("insert", "new table as new_rows"),
+        ("update", "new table as new_rows"),
+        ("delete", "old table as old_rows"),
+    ):
+        conn.execute(
+            sql.SQL(
+                "create trigger {} after {} on {} referencing {} for each statement execute function bootcampx_notify_change()"
+            ).format(sql.Identifier(f"{table}_notify_{op}"), sql.SQL(op), sql.Identifier(table), sql.SQL(referencing))
+        )
+
+
+def _has_trigger(conn: psycopg.Connection[Any], table: str, name: str) -> bool:
+    return conn.execute(
+        "select exists (select from pg_trigger where tgrelid = %s::regclass and tgname = %s)", (table, name)
+    ).fetchone()[0]
+
+
+def ensure_stock_ledger(conn: psycopg.Connection[Any], enabled: bool) -> None:
+    # Switches sales between the stock triggers of the documented schema
+    # (prevent_oversell, decrement_stock_after_sale) and the ledger. Altering
+    # the triggers locks out inserts into sales until commit, so no sale is
+    # applied by both or neither. Switching back posts every open movement.
+    installed = _exists(conn, "stock_movements")
+    if not installed:
+        if not enabled:
+            return
+        conn.execute(_STOCK_LEDGER)
+        _create_notify_triggers(conn, "stock_movements")
+        conn.execute("alter table sales disable trigger sales_00_stock_ledger")
+    elif _has_trigger(conn, "sales", "stock_ledger_sales"):
+        # Installed under its old name, which fired after sales_daily_insert.
+        conn.execute("alter trigger stock_ledger_sales on sales rename to sales_00_stock_ledger")
+    active = conn.execute(
+        "select tgenabled <> 'D' from pg_trigger where tgrelid = 'sales'::regclass and tgname = 'sales_00_stock_ledger'"
+    ).fetchone()[0]
+    if enabled and not active:
+        conn.execute(
+            """
+            alter table sales
+              disable trigger prevent_oversell,
+              disable trigger decrement_stock_after_sale,
+              enable trigger sales_00_stock_ledger
+            """
+        )
+    elif not enabled and active:
+        conn.execute(
+            """
+            alter table sales
+              disable trigger sales_00_stock_ledger,
+              enable trigger prevent_oversell,
+              enable trigger decrement_stock_after_sale
+            """
+        )
+        conn.execute("select stock_ledger_compact()")
+
+
+def ensure_trgm(conn: psycopg.Connection[Any]) -> bool:
+    # Needs autocommit: a failed create extension must not abort a transaction.
+    try:
+        conn.execute("create extension if not exists pg_trgm")
+    except psycopg.Error:
+        return False
+    return True
+
+
+def ensure_indexes(conn: psycopg.Connection[Any]) -> None:
+    # Built concurrently so a first start against a large table never blocks
+    # the tills; that needs autocommit, so it runs outside ensure()'s transaction.
+    conn.autocommit = True
+    try:
+        conn.execute("select pg_advisory_lock(hashtext('bootcampx.schema'))")
+        try:
+            indexes = _INDEXES + (_TRGM_INDEXES if ensure_trgm(conn) else [])
+            partitioned = sales_is_partitioned(conn)
+            for table, name, definition in indexes:
+                if partitioned and table == "sales":
+                    _create_partitioned_index(conn, name, definition)
+                else:
+                    conn.execute(f"create index concurrently if not exists {name} on {table} {definition}")
+        finally:
+            conn.execute("select pg_advisory_unlock(hashtext('bootcampx.schema'))")
+    finally:
+        conn.autocommit = False
+
+
+def _create_partitioned_index(conn: psycopg.Connection[Any], name: str, definition: str) -> None:
+    # A partitioned table cannot be indexed concurrently, and a plain build
+    # blocks inserts into every partition. Instead the index is created on the
+    # parent only (empty and invalid until complete), each partition's index is
+    # built concurrently and attached; the parent becomes valid once all are.
+    # Partitions created later get the index from the parent.
+    valid = conn.execute("select indisvalid from pg_index where indexrelid = to_regclass(%s)", (name,)).fetchone()
+    if valid and valid[0]:
+        return
+    conn.execute(f"create index if not exists {name} on only sales {definition}")
+    missing = conn.execute(
+        """
+        select c.relname
+        from pg_inherits p
+        join pg_class c on c.oid = p.inhrelid
+        where p.inhparent = 'sales'::regclass
+          and not exists (
+            select
+            from pg_inherits pi
+            join pg_index i on i.indexrelid = pi.inhrelid
+            where pi.inhparent = %s::regclass and i.indrelid = p.inhrelid
+          )
+        order by 1
+        """,
+        (name,),
+    ).fetchall()
+    for (partition,) in missing:
+        index_name = f"{partition}_{name.removeprefix('sales_')}"
+        index = sql.Identifier(index_name)
+        # An index left invalid by an interrupted build is dropped and rebuilt.
+        invalid = conn.execute(
+            "select not indisvalid from pg_index where indexrelid = to_regclass(%s)", (index_name,)
+        ).fetchone()
+        if invalid and invalid[0]:
+            conn.execute(sql.SQL("drop index concurrently {}").format(index))
+        conn.execute(
+            sql.SQL("create index concurrently if not exists {} on {} {}").format(
+                index, sql.Identifier(partition), sql.SQL(definition)
+            )
+        )
+        conn.execute(sql.SQL("alter index {} attach partition {}").format(sql.Identifier(name), index))
+
+
+def sales_is_partitioned(conn: psycopg.Connection[Any]) -> bool:
+    return conn.execute("select relkind = 'p' from pg_class where oid = 'sales'::regclass").fetchone()[0]
+
+
+def _partition_name(month: date) -> str:
+    return f"sales_p{month:%Y%m}"
+
+
+def ensure_sales_partitions(
+    conn: psycopg.Connection[Any],
+    months_ahead: int | None = None,
+    since: Any = None,
+) -> None:
+    if not sales_is_partitioned(conn):
+        return
+    if months_ahead is None:
+        months_ahead = int(db._setting("SALES_PARTITION_MONTHS_AHEAD", "3"))
+    if since is None:
+        since = conn.execute("select min(sold_at) from sales").fetchone()[0]
+
+    # Bounds are computed by Postgres so they follow the session time zone, the
+    # same one sold_at::date and date_trunc use everywhere else.
+    months = conn.execute(
+        """
+        select m::date, m, m + interval '1 month'
+        from generate_series(
+          date_trunc('month', least(%s::timestamptz, now())),
+          date_trunc('month', now()) + make_interval(months => %s),
+          interval '1 month'
+        ) as m
+        """,
+        (since, months_ahead),
+    ).fetchall()
+    existing = {
+        row[0]
+        for row in conn.execute(
+            "select c.relname from pg_inherits i join pg_class c on c.oid = i.inhrelid where i.inhparent = 'sales'::regclass"
+        )
+    }
+    for month, start, end in months:
+        name = _partition_name(month)
+        if name in existing:
+            continue
+        bounds = sql.SQL("for values from ({}) to ({})").format(sql.Literal(start), sql.Literal(end))
+        if "sales_default" in existing and conn.execute(
+            "select exists (select from sales_default where sold_at >= %s and sold_at < %s)", (start, end)
+        ).fetchone()[0]:
+            _split_default_partition(conn, name, bounds, start, end)
+        else:
+            conn.execute(sql.SQL("create table {} partition of sales {}").format(sql.Identifier(name), bounds))
+    if "sales_default" not in existing:
+        conn.execute("create table sales_default partition of sales default")
+
+
+def _split_default_partition(
+    conn: psycopg.Connection[Any], name: str, bounds: sql.Composable, start: datetime, end: datetime
+) -> None:
+    # Postgres refuses to create a partition while the default one holds rows
+    # in its range (sales for a month that had no partition yet). Detach the
+    # default, build the month as a plain table, move its rows there and attach
+    # both again. Detached tables carry no triggers, so the move does not
+    # re-apply stock or rollup changes. sales stays locked until commit.
+    table = sql.Identifier(name)
+    columns = sql.SQL(", ").join(map(sql.Identifier, _insertable_columns(conn, "sales")))
+    conn.execute("alter table sales detach partition sales_default")
+    conn.execute(
+        sql.SQL("create table {} (like sales_default including defaults including generated including constraints)").format(
+            table
+        )
+    )
+    conn.execute(
+        sql.SQL("insert into {} ({}) select {} from sales_default where sold_at >= %s and sold_at < %s").format(
+            table, columns, columns
+        ),
+        (start, end),
+    )
+    conn.execute("delete from sales_default where sold_at >= %s and sold_at < %s", (start, end))
+    conn.execute(sql.SQL("alter table sales attach partition {} {}").format(table, bounds))
+    conn.execute("alter table sales attach partition sales_default default")
+
+
+def _insertable_columns(conn: psycopg.Connection[Any], table: str) -> list[str]:
+    # Every column but generated ones, in table order.
+    return [
+        row[0]
+        for row in conn.execute(
+            """
+            select attname
+            from pg_attribute
+            where attrelid = %s::regclass and attnum > 0 and not attisdropped and attgenerated = ''
+            order by attnum
+            """,
+            (table,),
+        )
+    ]
+
+
+def partition_sales(conn: psycopg.Connection[Any], months_ahead: int | None = None) -> None:
+    # One-off conversion of the plain sales heap into monthly range partitions on
+    # sold_at. It holds an exclusive lock on sales while rows are copied, so run
+    # it outside trading hours. Triggers (prevent_oversell,
+    # decrement_stock_after_sale, the rollup), foreign keys and secondary
+    # indexes are captured first and recreated on the partitioned table; the
+    # triggers are recreated after the copy so existing rows are not re-applied.
+    if sales_is_partitioned(conn):
+        return
+    conn.execute("lock table sales in access exclusive mode")
+
+    referencing = conn.execute(
+        "select conname from pg_constraint where contype = 'f' and confrelid = 'sales'::regclass"
+    ).fetchall()
+    if referencing:
+        raise RuntimeError(f"Foreign keys reference sales ({', '.join(r[0] for r in referencing)}); drop them first.")
+
+    triggers = conn.execute(
+        """
+        select pg_get_triggerdef(oid), tgname, tgenabled = 'D'
+        from pg_trigger
+        where tgrelid = 'sales'::regclass and not tgisinternal
+        order by tgname
+        """
+    ).fetchall()
+    foreign_keys = conn.execute(
+        """
+        select conname, pg_get_constraintdef(oid)
+        from pg_constraint
+        where conrelid = 'sales'::regclass and contype = 'f'
+        """
+    ).fetchall()
+    indexes = conn.execute(
+        """
+        select pg_get_indexdef(i.indexrelid)
+        from pg_index i
+        where i.indrelid = 'sales'::regclass and not i.indisunique
+        """
+    ).fetchall()
+    columns = _insertable_columns(conn, "sales")
+    identity = conn.execute(
+        "select attidentity <> '' from pg_attribute where attrelid = 'sales'::regclass and attname = 'sale_id'"
+    ).fetchone()[0]
+    sequence = conn.execute("select pg_get_serial_sequence('sales', 'sale_id')").fetchone()[0]
+
+    conn.execute("alter table sales rename to sales_unpartitioned")
+    conn.execute(
+        """
+        create table sales (
+          like sales_unpartitioned including defaults including generated including constraints including identity
+        ) partition by range (sold_at)
+        """
+    )
+    since = conn.execute("select min(sold_at) from sales_unpartitioned").fetchone()[0]
+    ensure_sales_partitions(conn, months_ahead, since)
+
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    conn.execute(
+        sql.SQL("insert into sales ({}) overriding system value select {} from sales_unpartitioned").format(
+            column_list, column_list
+        )
+    )
+
+    if identity:
+        conn.execute(
+            "select setval(pg_get_serial_sequence('sales', 'sale_id'), coalesce(max(sale_id), 0) + 1, false) from sales"
+        )
+    elif sequence:
+        # Keep the existing serial sequence: detach it from the old table before
+        # dropping it, then hand ownership to the new column.
+        conn.execute(sql.SQL("alter sequence {} owned by none").format(sql.SQL(sequence)))
+    conn.execute("drop table sales_unpartitioned")
+    if sequence and not identity:
+        conn.execute(sql.SQL("alter sequence {} owned by sales.sale_id").format(sql.SQL(sequence)))
+
+    conn.execute("alter table sales add primary key (sale_id, sold_at)")
+    for name, definition in foreign_keys:
+        conn.execute(
+            sql.SQL("alter table sales add constraint {} {}").format(sql.Identifier(name), sql.SQL(definition))
+        )
+    for (definition,) in indexes:
+        conn.execute(definition)
+    for definition, name, disabled in triggers:
+        conn.execute(definition)
+        if disabled:
+            conn.execute(sql.SQL("alter table sales disable trigger {}").format(sql.Identifier(name)))
+
+
+# A plain detach holds ACCESS EXCLUSIVE on sales, and while it waits for
+# running queries every new checkout queues behind it; so it waits at most
+# this long per attempt and retries instead.
+_DETACH_LOCK_TIMEOUT = "2s"
+_DETACH_ATTEMPTS = 10
+
+
+def detach_sales_partition(conn: psycopg.Connection[Any], month: date) -> str:
+    # The detached table keeps its rows and can be archived or dropped later;
+    # sales_daily keeps the month's totals either way. On Postgres 14+ the
+    # detach runs concurrently, which only takes SHARE UPDATE EXCLUSIVE and so
+    # never blocks sales; that needs autocommit, and Postgres refuses it while
+    # sales has a default partition (sales_default, unless it was dropped).
+    name = _partition_name(month.replace(day=1))
+    detach = sql.SQL("alter table sales detach partition {}").format(sql.Identifier(name))
+    conn.autocommit = True
+    try:
+        conn.execute("select pg_advisory_lock(hashtext('bootcampx.schema'))")
+        try:
+            if conn.info.server_version < 140000:
+                _detach_with_lock_timeout(conn, detach)
+            elif _detach_pending(conn, name):
+                # An interrupted concurrent detach left the partition half-detached.
+                conn.execute(detach + sql.SQL(" finalize"))
+            elif _has_default_partition(conn, "sales"):
+                _detach_with_lock_timeout(conn, detach)
+            else:
+                conn.execute(detach + sql.SQL(" concurrently"))
+        finally:
+            conn.execute("select pg_advisory_unlock(hashtext('bootcampx.schema'))")
+    finally:
+        conn.autocommit = False
+    return name
+
+
+def _detach_pending(conn: psycopg.Connection[Any], partition: str) -> bool:
+    return conn.execute(
+        "select exists (select from pg_inherits where inhrelid = to_regclass(%s) and inhdetachpending)", (partition,)
+    ).fetchone()[0]
+
+
+def _has_default_partition(conn: psycopg.Connection[Any], table: str) -> bool:
+    return conn.execute(
+        "select exists (select from pg_partitioned_table where partrelid = %s::regclass and partdefid <> 0)", (table,)
+    ).fetchone()[0]
+
+
+def _detach_with_lock_timeout(conn: psycopg.Connection[Any], detach: sql.Composable) -> None:
+    for attempt in range(1, _DETACH_ATTEMPTS + 1):
+        try:
+            with conn.transaction():
+                conn.execute(f"set local lock_timeout = '{_DETACH_LOCK_TIMEOUT}'")
+                conn.execute(detach)
+            return
+        except psycopg.errors.LockNotAvailable:
+            if attempt == _DETACH_ATTEMPTS:
+                raise
+            time.sleep(attempt)
+
+
+@st.cache_data(ttl=int(db._setting("SALES_PARTITION_CHECK_SECONDS", "3600")), show_spinner=False)
+def check_sales_partitions() -> None:
+    # ensure() runs once per process; this repeats the month check so a
+    # long-running process keeps adding the months ahead as time passes.
+    with db.transaction() as conn:
+        conn.execute("select pg_advisory_xact_lock(hashtext('bootcampx.schema'))")
+        ensure_sales_partitions(conn)
+
+
+@st.cache_resource
+def ensure() -> None:
+    with db.transaction() as conn:
+        conn.execute("select pg_advisory_xact_lock(hashtext('bootcampx.schema'))")
+        ensure_sales_daily(conn)
+        ensure_items_updated_at(conn)
+        ensure_change_notify(conn)
+        conn.execute(_QUEUED_SALE_REFS)
+        ensure_stock_ledger(conn, db.stock_ledger_enabled())
+        ensure_sales_partitions(conn)
+    with db.get_connection() as conn:
+        ensure_indexes(conn)
+    if db.stock_ledger_enabled():
+        db.stock_compactor()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the app's database schema.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    partition = commands.add_parser("partition-sales", help="convert sales to monthly range partitions")
+    partition.add_argument("--months-ahead", type=int, default=None)
+    detach = commands.add_parser("detach-sales", help="detach one month's sales partition")
+    detach.add_argument("month", help="YYYY-MM")
+    args = parser.parse_args()
+
+    if args.command == "detach-sales":
+        # Manages its own transactions (see detach_sales_partition).
+        with db.get_connection() as conn:
+            print(f"Detached {detach_sales_partition(conn, date.fromisoformat(args.month + '-01'))}.")
+        return
+
+    with db.transaction() as conn:
+        conn.execute("select pg_advisory_xact_lock(hashtext('bootcampx.schema'))")
+        partition_sales(conn, args.months_ahead)
+        print("sales is partitioned by month.")
+
+
+if __name__ == "__main__":
+    main()
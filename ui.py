@@ -6,5 +6,11 @@ import streamlit as st
 LOGO_PATH = "assets/logo.png"
 
 
+@st.cache_resource
+def logo() -> bytes:
+    with open(LOGO_PATH, "rb") as f:
+        return f.read()
+
+
 def render_branding() -> None:
-    st.sidebar.image(LOGO_PATH, use_container_width=True)
+    st.sidebar.image(logo(), use_container_width=True)